@@ -0,0 +1,23 @@
+import os
+import shutil
+import tempfile
+
+import blib.cache
+
+_cache_directory = None
+
+
+def pytest_configure(config):
+    # Tests must neither read nor write the user's cache, so the shared cache is kept in a temporary directory which
+    # is removed at the end of the session
+    global _cache_directory
+    _cache_directory = tempfile.mkdtemp(prefix='blib-test-cache-')
+    os.environ['BLIB_CACHE_DIR'] = _cache_directory
+    blib.cache.configure_cache()
+
+
+def pytest_unconfigure(config):
+    if blib.cache._cache is not None:
+        blib.cache._cache.close()
+        blib.cache._cache = None
+    shutil.rmtree(_cache_directory, ignore_errors=True)
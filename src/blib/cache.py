@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+try:
+    has_diskcache = True
+    import diskcache as dc
+except ImportError:
+    has_diskcache = False
+
+DEFAULT_CACHE_SIZE = int(1e8) # 100 MB
+DEFAULT_MEMORY_CACHE_SIZE = 1024 # entries
+DEFAULT_EVICTION_POLICY = 'least-recently-stored'
+EVICTION_POLICIES = ('least-recently-stored', 'least-recently-used', 'least-frequently-used', 'none')
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def cache_directory():
+    """
+    Return the directory of the blib cache.
+
+    This is `$BLIB_CACHE_DIR` if it is set, otherwise `blib` inside the XDG cache directory (`$XDG_CACHE_HOME`, which
+    defaults to `~/.cache`). The location does not depend on the working directory so the cache is shared between
+    every project blib is run from.
+    """
+    if directory := os.environ.get('BLIB_CACHE_DIR'):
+        return os.path.expanduser(directory)
+
+    xdg_cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join('~', '.cache')
+    return os.path.join(os.path.expanduser(xdg_cache_home), 'blib')
+
+
+def shared_cache():
+    """Return the cache shared by all providers, opening it on first use. Returns `None` if diskcache is missing."""
+    global _cache
+    if not has_diskcache:
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = _open_cache()
+        return _cache
+
+
+def configure_cache(directory=None, size_limit=None, eviction_policy=None):
+    """
+    Reopen the shared cache with the given settings. Settings which are not given are read from the environment
+    (`BLIB_CACHE_DIR`, `BLIB_CACHE_SIZE` in bytes and `BLIB_CACHE_EVICTION`) or take their default value.
+    """
+    global _cache
+    if not has_diskcache:
+        return None
+
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+        _cache = _open_cache(directory, size_limit, eviction_policy)
+        return _cache
+
+
+def provider_cache(namespace):
+    """
+    Return a view of the shared cache where all keys belong to `namespace`. Returns `None` if diskcache is missing.
+    """
+    cache = shared_cache()
+    if cache is None:
+        return None
+    return NamespacedCache(cache, namespace)
+
+
+class NamespacedCache:
+    """
+    View of a diskcache with every key prefixed by a namespace, so that providers can share one cache without their
+    keys colliding (e.g. an arXiv id which is also valid as part of a DOI).
+    """
+
+    def __init__(self, cache, namespace):
+        self._cache = cache
+        self.namespace = namespace
+
+    def _key(self, key):
+        return f'{self.namespace}:{key}'
+
+    def __contains__(self, key):
+        return self._key(key) in self._cache
+
+    def __getitem__(self, key):
+        return self._cache[self._key(key)]
+
+    def __setitem__(self, key, value):
+        self._cache[self._key(key)] = value
+
+    def __delitem__(self, key):
+        del self._cache[self._key(key)]
+
+    def get(self, key, default=None):
+        return self._cache.get(self._key(key), default)
+
+    def set(self, key, value, expire=None):
+        return self._cache.set(self._key(key), value, expire=expire)
+
+
+class MemoryCache:
+    """
+    Thread safe in-memory LRU cache holding up to `maxsize` entries.
+
+    This sits in front of the disk cache and holds results which have already been normalised. A hit skips reading
+    and unpickling the entry from SQLite, so ids repeated in one run or looked up again by a long lived process are
+    returned straight away. `hits` and `misses` count the lookups made with `get`.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MEMORY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __setitem__(self, key, value):
+        if self.maxsize < 1:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def cache_record(raw, result, schema, fields=None):
+    """
+    Return a cache entry holding a provider's `raw` response (bytes) next to the `result` normalised from it.
+
+    The raw response is stored compressed along with the `schema` version of the normaliser which produced `result`.
+    When the normalisation changes the provider can re-derive the result from the raw response locally, rather than
+    the whole cache having to be cleared and refetched over the network. If the response only contains some `fields`
+    of the full record these are stored too, so the provider can tell whether re-deriving is possible.
+    """
+    return {'schema': schema, 'raw': zlib.compress(raw), 'result': result, 'fields': fields}
+
+
+def is_cache_record(entry):
+    return isinstance(entry, dict) and 'schema' in entry and 'raw' in entry
+
+
+def cache_record_raw(record):
+    return zlib.decompress(record['raw'])
+
+
+def negative_cache_record(error, message, ttl):
+    """
+    Return a cache entry recording that a lookup failed with `error` (a short string such as "not-found"). The entry is
+    treated as missing once `ttl` seconds have passed so the lookup is eventually retried.
+    """
+    return {'error': error, 'message': message, 'expires': time.time() + ttl}
+
+
+def is_negative_cache_record(entry):
+    return isinstance(entry, dict) and 'error' in entry and 'expires' in entry
+
+
+def is_expired(record):
+    return record['expires'] <= time.time()
+
+
+def _open_cache(directory=None, size_limit=None, eviction_policy=None):
+    directory = directory or cache_directory()
+    size_limit = size_limit or int(float(os.environ.get('BLIB_CACHE_SIZE') or DEFAULT_CACHE_SIZE))
+    eviction_policy = eviction_policy or os.environ.get('BLIB_CACHE_EVICTION') or DEFAULT_EVICTION_POLICY
+
+    if eviction_policy not in EVICTION_POLICIES:
+        raise ValueError(f'unknown cache eviction policy "{eviction_policy}", expected one of {EVICTION_POLICIES}')
+
+    return dc.Cache(directory, size_limit=size_limit, eviction_policy=eviction_policy)
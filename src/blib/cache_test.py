@@ -0,0 +1,65 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import diskcache as dc
+
+from blib.cache import MemoryCache, NamespacedCache, _open_cache, cache_directory
+
+
+class CacheTest(TestCase):
+    def test_cache_directory_uses_blib_cache_dir(self):
+        with patch.dict(os.environ, {'BLIB_CACHE_DIR': '/srv/blib-cache', 'XDG_CACHE_HOME': '/xdg'}):
+            self.assertEqual(cache_directory(), '/srv/blib-cache')
+
+    def test_cache_directory_uses_xdg_cache_home(self):
+        with patch.dict(os.environ, {'XDG_CACHE_HOME': '/xdg'}):
+            os.environ.pop('BLIB_CACHE_DIR', None)
+            self.assertEqual(cache_directory(), os.path.join('/xdg', 'blib'))
+
+    def test_cache_directory_defaults_to_home_cache(self):
+        with patch.dict(os.environ, {}):
+            os.environ.pop('BLIB_CACHE_DIR', None)
+            os.environ.pop('XDG_CACHE_HOME', None)
+            self.assertEqual(cache_directory(), os.path.join(os.path.expanduser('~'), '.cache', 'blib'))
+
+    def test_namespaces_do_not_collide(self):
+        with tempfile.TemporaryDirectory() as directory, dc.Cache(directory) as cache:
+            crossref = NamespacedCache(cache, 'crossref')
+            arxiv = NamespacedCache(cache, 'arxiv')
+
+            crossref['2101.00001'] = 'crossref'
+            arxiv['2101.00001'] = 'arxiv'
+
+            self.assertEqual(crossref['2101.00001'], 'crossref')
+            self.assertEqual(arxiv['2101.00001'], 'arxiv')
+            self.assertNotIn('2101.00002', arxiv)
+            self.assertEqual(arxiv.get('2101.00002', 'missing'), 'missing')
+
+    def test_open_cache_reads_settings_from_environment(self):
+        with tempfile.TemporaryDirectory() as directory, \
+             patch.dict(os.environ, {'BLIB_CACHE_SIZE': '2e6', 'BLIB_CACHE_EVICTION': 'least-recently-used'}):
+            cache = _open_cache(directory)
+            try:
+                self.assertEqual(cache.size_limit, 2000000)
+                self.assertEqual(cache.eviction_policy, 'least-recently-used')
+            finally:
+                cache.close()
+
+    def test_open_cache_rejects_unknown_eviction_policy(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaisesRegex(ValueError, 'unknown cache eviction policy'):
+                _open_cache(directory, eviction_policy='random')
+
+    def test_memory_cache_evicts_least_recently_used_entry(self):
+        cache = MemoryCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache.get('a'), 1)
+
+        cache['c'] = 3
+
+        self.assertNotIn('b', cache)
+        self.assertEqual([cache.get('a'), cache.get('b'), cache.get('c')], [1, None, 3])
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
@@ -0,0 +1,141 @@
+import atexit
+import multiprocessing.util
+import os
+import subprocess
+import threading
+
+EXIFTOOL_EXECUTABLE = 'exiftool'
+
+# Seconds to wait for exiftool to exit when a session is closed
+EXIFTOOL_CLOSE_TIMEOUT = 5
+
+_session = None
+_session_lock = threading.Lock()
+_exiftool_missing = False
+
+
+class ExifTool:
+    """
+    A long running `exiftool -stay_open True -@ -` process which commands are streamed to.
+
+    Starting exiftool loads a Perl interpreter and takes hundreds of milliseconds, so reading the metadata of many
+    files with a new exiftool process for each one is slow. A session starts exiftool once and then sends the
+    arguments of each command on its standard input, which only costs milliseconds per file.
+
+    A session belongs to the process which started it. After a fork the child must start its own session rather than
+    write to the pipes of its parent's exiftool.
+    """
+
+    def __init__(self, executable=EXIFTOOL_EXECUTABLE):
+        self.executable = executable
+        self._process = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def running(self):
+        return self._process is not None and self._pid == os.getpid() and self._process.poll() is None
+
+    def start(self):
+        """Start exiftool. Raises FileNotFoundError if exiftool is not installed."""
+        self._process = subprocess.Popen(
+            [self.executable, '-stay_open', 'True', '-@', '-'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        self._pid = os.getpid()
+
+    def execute(self, *args):
+        """
+        Run exiftool with `args` and return its output. Raises BrokenPipeError if exiftool is not running, and
+        ValueError for arguments containing a newline as these cannot be sent to exiftool.
+        """
+        if any('\n' in arg for arg in args):
+            raise ValueError('exiftool arguments cannot contain newlines')
+
+        with self._lock:
+            if not self.running:
+                raise BrokenPipeError('exiftool is not running')
+
+            self._process.stdin.write(''.join(f'{arg}\n' for arg in (*args, '-execute')).encode('utf-8'))
+            self._process.stdin.flush()
+
+            # exiftool prints {ready} once the output of a command is complete
+            lines = []
+            while (line := self._process.stdout.readline()).rstrip(b'\r\n') != b'{ready}':
+                if not line:
+                    raise BrokenPipeError('exiftool exited unexpectedly')
+                lines.append(line)
+            return b''.join(lines).decode('utf-8', errors='replace')
+
+    def close(self):
+        if self.running:
+            try:
+                self._process.stdin.write(b'-stay_open\nFalse\n')
+                self._process.stdin.flush()
+                self._process.wait(timeout=EXIFTOOL_CLOSE_TIMEOUT)
+            except (OSError, subprocess.TimeoutExpired):
+                self._process.kill()
+        self._process = None
+
+
+def exiftool_session():
+    """
+    Return the exiftool session of this process, starting it on first use. Raises FileNotFoundError if exiftool is not
+    installed.
+    """
+    global _session, _exiftool_missing
+    with _session_lock:
+        if _exiftool_missing:
+            raise FileNotFoundError(EXIFTOOL_EXECUTABLE)
+
+        if _session is None or not _session.running:
+            session = ExifTool(EXIFTOOL_EXECUTABLE)
+            try:
+                session.start()
+            except FileNotFoundError:
+                _exiftool_missing = True
+                raise
+            atexit.register(session.close)
+            _session = session
+        return _session
+
+
+def close_exiftool_session():
+    """Close the exiftool session of this process if one is running."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            # A session inherited from the parent process is not running in this process, so this leaves it alone
+            _session.close()
+            _session = None
+
+
+def close_exiftool_session_at_exit():
+    """
+    Close the exiftool session of this process when it exits. Worker processes started by multiprocessing (e.g. the
+    workers of a `ProcessPoolExecutor`) exit without running `atexit` handlers, which would leave their exiftool
+    running, so this is used as the initializer of the pool.
+    """
+    multiprocessing.util.Finalize(None, close_exiftool_session, exitpriority=0)
+
+
+def exiftool(*args):
+    """
+    Return the output of exiftool run with `args`, which is sent to the exiftool session of this process. Raises
+    FileNotFoundError if exiftool is not installed.
+    """
+    try:
+        return exiftool_session().execute(*args)
+    except (BrokenPipeError, ValueError):
+        # Fall back to running exiftool once, e.g. for a filename containing a newline
+        pass
+
+    result = subprocess.run([EXIFTOOL_EXECUTABLE, *args], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return result.stdout.decode('utf-8', errors='replace')
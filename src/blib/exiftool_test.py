@@ -0,0 +1,75 @@
+import multiprocessing
+import os
+import stat
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from unittest import TestCase
+from unittest.mock import patch
+
+from blib.exiftool import ExifTool, close_exiftool_session_at_exit, exiftool
+
+# Answers commands in the same way as `exiftool -stay_open True -@ -` by echoing their arguments. When it is told to
+# stop it records this in a `closed` file next to it.
+FAKE_EXIFTOOL = '''\
+import os
+import sys
+args = []
+for line in sys.stdin:
+    arg = line.rstrip('\\n')
+    if arg == '-execute':
+        print(' '.join(args))
+        print('{ready}', flush=True)
+        args = []
+    elif args == ['-stay_open'] and arg == 'False':
+        open(os.path.join(os.path.dirname(sys.argv[0]), 'closed'), 'w').close()
+        break
+    else:
+        args.append(arg)
+'''
+
+
+class TestExifTool(TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.executable = os.path.join(self._directory.name, 'exiftool')
+        with open(self.executable, 'w') as f:
+            f.write(f'#!{sys.executable}\n{FAKE_EXIFTOOL}')
+        os.chmod(self.executable, os.stat(self.executable).st_mode | stat.S_IEXEC)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_commands_are_sent_to_one_process(self):
+        with ExifTool(executable=self.executable) as session:
+            pid = session._process.pid
+            self.assertEqual(session.execute('-keywords', 'a.pdf'), '-keywords a.pdf\n')
+            self.assertEqual(session.execute('-keywords', 'b.pdf'), '-keywords b.pdf\n')
+            self.assertEqual(session._process.pid, pid)
+            process = session._process
+
+        self.assertEqual(process.returncode, 0)
+        self.assertFalse(session.running)
+
+    def test_arguments_with_newlines_are_rejected(self):
+        with ExifTool(executable=self.executable) as session:
+            self.assertRaises(ValueError, session.execute, 'a\nb.pdf')
+
+    def test_execute_raises_when_not_running(self):
+        self.assertRaises(BrokenPipeError, ExifTool(executable=self.executable).execute, 'a.pdf')
+
+    def test_missing_exiftool_raises_file_not_found(self):
+        session = ExifTool(executable=os.path.join(self._directory.name, 'missing'))
+        self.assertRaises(FileNotFoundError, session.start)
+
+    def test_sessions_of_pool_workers_are_closed_when_the_workers_exit(self):
+        # Forked workers inherit the patched executable
+        context = multiprocessing.get_context('fork')
+        with patch('blib.exiftool.EXIFTOOL_EXECUTABLE', self.executable), \
+             patch('blib.exiftool._session', None), \
+             patch('blib.exiftool._exiftool_missing', False):
+            with ProcessPoolExecutor(
+                    max_workers=1, mp_context=context, initializer=close_exiftool_session_at_exit) as executor:
+                self.assertEqual(executor.submit(exiftool, '-keywords', 'a.pdf').result(), '-keywords a.pdf\n')
+
+        self.assertTrue(os.path.exists(os.path.join(self._directory.name, 'closed')))
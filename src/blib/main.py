@@ -7,13 +7,15 @@ import os
 import re
 import subprocess
 import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from html.parser import HTMLParser
 from urllib.error import URLError
-from urllib.parse import urlparse
-from urllib.request import Request, urlopen
+from urllib.parse import quote, urlparse
 
 import blib.providers
 from blib.exception import DoiTypeError
+from blib.exiftool import close_exiftool_session_at_exit, exiftool
 from blib.formatting.bibtex import BibtexFormatter
 from blib.formatting.data_formatter import DataFormatter
 from blib.formatting.doi_formatter import DoiFormatter
@@ -21,7 +23,12 @@ from blib.formatting.markdown import MarkdownFormatter
 from blib.formatting.richtext import RichTextFormatter
 from blib.formatting.richtext_review import RichTextReviewFormatter
 from blib.formatting.text_formatter import TextFormatter
+from blib.pdfmetadata import pdf_metadata_strings
+from blib.pdftext import PDF_TEXT_BACKENDS, pdf_text_backend, pdftotext_available, pdftotext_pages
+from blib.providers.retry import RetryPolicy
+from blib.providers.transport import OfflineError, configure_transport, default_transport
 from blib.resourceid import ResourceId, ResourceIdType
+from blib.scanindex import ScanIndex
 
 try:
     has_pdfplumber = True
@@ -41,6 +48,17 @@ DOI_REGEX = r'10\.\d{4,}(?:\.\d+)*\/(?!\(ISSN\))[^\s"\'<>]*[^\s"\'<>\.,;:?!\)]'
 ARXIV_REGEX = r'ar[xX]iv.*([0-9]{2}[0-1][0-9]\.[0-9]{4,}(?:v[0-9]+)?)'
 ORCID_REGEX = r'^\d{4}-\d{4}-\d{4}-\d{4}$'
 ARXIV_DOI_REGEX = r'10\.48550/ar[xX]iv\.([0-9]{2}[0-1][0-9]\.[0-9]{4,}(?:v[0-9]+)?)'
+DOI_PREFIX_REGEX = r'^(?:https?://(?:dx\.)?doi\.org/|doi:)\s*'
+ARXIV_VERSION_REGEX = r'v[0-9]+$'
+
+# Maximum number of concurrent requests used to check which DOI candidates exist
+MAX_DOI_PROBES = 8
+
+# Fractions of the height (header and footer bands) and width (margin strips) of a pdf page where DOIs are usually
+# printed, which are searched before the whole page
+PDF_HEADER_FRACTION = 0.15
+PDF_FOOTER_FRACTION = 0.15
+PDF_MARGIN_FRACTION = 0.1
 
 
 def is_valid_orcid(orcid):
@@ -50,6 +68,36 @@ def is_valid_orcid(orcid):
         )
     return orcid
 
+def orcid_list(value):
+    """Return the list of ORCID iDs in a comma separated string."""
+    return [is_valid_orcid(orcid.strip()) for orcid in value.split(',') if orcid.strip()]
+
+def partial_date(value):
+    """Return a date in the format YYYY, YYYY-MM or YYYY-MM-DD as a (year, month, day) tuple of which month and day
+    may be `None`."""
+    match = re.fullmatch(r'(\d{4})(?:-(\d{1,2})(?:-(\d{1,2}))?)?', value.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(
+            'date must be in the format YYYY, YYYY-MM or YYYY-MM-DD'
+        )
+    year, month, day = (int(part) if part else None for part in match.groups())
+    if (month is not None and not 1 <= month <= 12) or (day is not None and not 1 <= day <= 31):
+        raise argparse.ArgumentTypeError(
+            f'invalid date {value}'
+        )
+    return year, month, day
+
+def is_positive_int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(
+            'must be a positive integer'
+        )
+    return number
+
 def is_url(string):
     try:
         result = urlparse(string)
@@ -84,6 +132,28 @@ def find_arxiv_id_from_doi(doi):
         return None
     return ResourceId(match.group(1), ResourceIdType.arxiv)
 
+def canonical_resource_id(resource_id, strip_arxiv_version=False):
+    """
+    Return `resource_id` in a canonical form so that different spellings of the same id are only resolved once.
+
+    DOIs are case insensitive so they are lower cased and any `https://doi.org/` or `doi:` prefix is removed. arXiv
+    DOIs are replaced by the arXiv id. arXiv ids have their version suffix removed if `strip_arxiv_version` is set, so
+    that "2101.00001v1" and "2101.00001v2" both resolve to the latest version.
+    """
+    if resource_id.type == ResourceIdType.doi:
+        doi = re.sub(DOI_PREFIX_REGEX, '', resource_id.id.strip(), flags=re.IGNORECASE)
+        if arxiv_id := find_arxiv_id_from_doi(doi):
+            return canonical_resource_id(arxiv_id, strip_arxiv_version)
+        return ResourceId(doi.lower(), ResourceIdType.doi)
+
+    if resource_id.type == ResourceIdType.arxiv:
+        arxiv_id = resource_id.id.strip()
+        if strip_arxiv_version:
+            arxiv_id = re.sub(ARXIV_VERSION_REGEX, '', arxiv_id)
+        return ResourceId(arxiv_id, ResourceIdType.arxiv)
+
+    return resource_id
+
 def find_all_resource_ids(string):
     """Return all the identifiers in `string`. Returns `None` if no identifiers are found."""
     id_list = []
@@ -124,6 +194,8 @@ def doi_from_webpage_meta_data(url):
 
     Some publishers don't like automated access of webpages and will block accesses with a captcha. It seems to be most
     common for publishers who do already have the DOI in the URL so returning that DOI first works in most cases.
+
+    Raises OfflineError if the webpage would have to be loaded while the transport is offline.
     """
 
     # If the url contains a valid DOI then return this. This will help us avoid annoying some services (e.g. IOP) which
@@ -131,19 +203,20 @@ def doi_from_webpage_meta_data(url):
     if resource_id := find_resource_id(url): return resource_id
 
     try:
-        with urlopen(Request(url, headers={'User-Agent': BLIB_HTTP_USER_AGENT})) as response:
-            # Decode the response to a string. This *should* be a json dataset which we then
-            # convert to a dictionary and return.
-            parser = HTMLDOIMetaParser()
+        response = default_transport().get(url, headers={'User-Agent': BLIB_HTTP_USER_AGENT})
 
-            html = response.read().decode('utf-8')
+        parser = HTMLDOIMetaParser()
 
-            parser.feed(html)
+        html = response.body.decode('utf-8')
 
-            if parser.doi:
-                return ResourceId(parser.doi, ResourceIdType.doi)
+        parser.feed(html)
 
-    except ValueError:
+        if parser.doi:
+            return ResourceId(parser.doi, ResourceIdType.doi)
+
+    except OfflineError:
+        raise
+    except (ValueError, URLError):
         return None
 
     return None
@@ -160,15 +233,15 @@ def doi_candidates(string):
     #          so we can't guarantee that the "meta" is not part of the DOI. The doiRegex function will give
     #          us "10.1088/0953-8984/28/47/476007/meta".
     # The solution below is to chomp backwards on "/" looking for a match until we have only the suffix and one prefix.
-    # This might be slow if there is a lot of junk on the end because we do a http request every time
-    doi = find_doi(string)
+    # The candidates are then checked together by `process_doi_string` rather than with a http request each.
+    resource_id = find_doi(string)
 
-    if doi is None:
-        doi = doi_from_webpage_meta_data(string)
-        if doi is None:
+    if resource_id is None:
+        resource_id = doi_from_webpage_meta_data(string)
+        if resource_id is None:
             raise ValueError(f'Not a valid DOI: "{string}"')
 
-    split_doi = doi.split("/")
+    split_doi = resource_id.id.split("/")
     return ["/".join(split_doi[0:n]) for n in range(len(split_doi), 1, -1)]
 
 
@@ -185,23 +258,69 @@ def crossref_entry(doi):
     # lookups are MUCH faster if we use no headers.
 
     url = f'https://api.crossref.org/works/{doi}'
-    with urlopen(Request(url, headers={'User-Agent' : BLIB_HTTP_USER_AGENT})) as response:
-        if not response.code == 200:
-            raise URLError(f"failed to resolve https://api.crossref.org/works/{doi}")
+    response = default_transport().get(url, headers={'User-Agent' : BLIB_HTTP_USER_AGENT})
 
-        # Decode the response to a string. This *should* be a json dataset which we then
-        # convert to a dictionary and return.
-        return json.loads(response.read().decode('utf-8'))['message']
+    # Decode the response to a string. This *should* be a json dataset which we then
+    # convert to a dictionary and return.
+    return json.loads(response.body.decode('utf-8'))['message']
 
 
-def process_doi_string(string):
-    for doi in doi_candidates(string):
+def crossref_entries(dois):
+    """
+    Return the crossref database entries for all of `dois` which exist, fetched with a single request. The result maps
+    lower cased DOIs to entries.
+
+    Raises URLError if the request fails. DOIs must not contain commas because these separate the values in the query.
+    """
+    doi_filter = ','.join(f'doi:{quote(doi, safe="/")}' for doi in dois)
+    url = f'https://api.crossref.org/works?filter={doi_filter}&rows={len(dois)}'
+    response = default_transport().get(url, headers={'User-Agent' : BLIB_HTTP_USER_AGENT})
+    items = json.loads(response.body.decode('utf-8'))['message']['items']
+    return {item['DOI'].lower(): item for item in items}
+
+
+def probe_crossref_entries(dois):
+    """
+    Return the crossref database entries for all of `dois` which exist, making the requests concurrently. The result
+    maps lower cased DOIs to entries.
+    """
+    if not dois:
+        return {}
+
+    def probe(doi):
         try:
             return crossref_entry(doi)
         except URLError:
-            continue
-    else:
-        raise ValueError(f'No crossref entry for any DOI candidates')
+            return None
+
+    with ThreadPoolExecutor(max_workers=min(len(dois), MAX_DOI_PROBES)) as executor:
+        return {doi.lower(): entry for doi, entry in zip(dois, executor.map(probe, dois)) if entry is not None}
+
+
+def process_doi_string(string):
+    """
+    Return the crossref database entry for the longest DOI candidate in `string` (see `doi_candidates`) which exists.
+
+    All candidates are checked in one round trip with a Crossref filter query. If that fails, or for candidates which
+    cannot be put in a filter, each candidate is looked up concurrently instead.
+    """
+    candidates = doi_candidates(string)
+    batchable = [doi for doi in candidates if ',' not in doi]
+
+    try:
+        entries = crossref_entries(batchable) if batchable else {}
+        unbatched = [doi for doi in candidates if ',' in doi]
+    except URLError:
+        entries, unbatched = {}, candidates
+
+    entries.update(probe_crossref_entries(unbatched))
+
+    for doi in candidates:
+        if (entry := entries.get(doi.lower())) is not None:
+            return entry
+
+    raise ValueError(f'No crossref entry for any DOI candidates')
+
 
 def find_resource_id_from_metadata(filename):
     # https://exiftool.org/examples.html
@@ -221,9 +340,9 @@ def find_resource_id_from_metadata(filename):
         pass
 
     try:
-        p = subprocess.Popen(['exiftool', '-keywords', '-MDItemWhereFroms', filename], stdout=subprocess.PIPE)
-        for line in p.stdout.readlines():
-            if resource_id := find_resource_id(line.decode()): return resource_id
+        # exiftool is kept running between files as starting it is slow
+        for line in exiftool('-keywords', '-MDItemWhereFroms', filename).splitlines():
+            if resource_id := find_resource_id(line): return resource_id
     except FileNotFoundError: # if exitfool is not found
         pass
 
@@ -251,23 +370,67 @@ def find_resource_id_from_chars(chars):
     return None
 
 
-def find_resource_id_from_pdf(filename, num_pages=2):
+def find_resource_id_from_page(page, search_text=True):
+    """
+    Attempt to find a resource id on a pdfplumber page.
+
+    Publishers usually print the DOI in the header or footer of the first page, or for preprints as rotated text in the
+    margin. These regions are cropped and searched first as extracting their text needs much less layout analysis than
+    the whole page. The whole page is only searched when none of them contain an id. Without `search_text` only the
+    rotated characters are searched, e.g. when the text has already been searched using pdftotext.
+    """
+    x0, top, x1, bottom = page.bbox
+    header_height = (bottom - top) * PDF_HEADER_FRACTION
+    footer_height = (bottom - top) * PDF_FOOTER_FRACTION
+    margin_width = (x1 - x0) * PDF_MARGIN_FRACTION
+
+    if search_text:
+        for bbox in ((x0, top, x1, top + header_height), (x0, bottom - footer_height, x1, bottom)):
+            if resource_id := find_resource_id(page.crop(bbox).extract_text()): return resource_id
+
+    for bbox in ((x0, top, x0 + margin_width, bottom), (x1 - margin_width, top, x1, bottom)):
+        if resource_id := find_resource_id_from_chars(page.crop(bbox).chars): return resource_id
+
+    if search_text and (resource_id := find_resource_id(page.extract_text())): return resource_id
+    return find_resource_id_from_chars(page.chars)
+
+
+def find_resource_id_from_pdf(filename, num_pages=2, pdf_backend='auto'):
     """
     Attempts to find a DOI from a pdf file.
 
-    This first checks the file metadata for a DOI. If none is found then it opens the pdf and checks the pdf metadata
-    for a DOI. If no DOI is found then it scrapes the text on the first `num_pages`
-    for DOIs. In all cases the first DOI found is returned.
+    This first checks the pdf metadata by scanning the raw bytes of the file, then the file metadata for a DOI. If
+    none is found then it opens the pdf and checks the pdf metadata for a DOI. If no DOI is found then it scrapes the
+    text on the first `num_pages` for DOIs. In all cases the first DOI found is returned.
+
+    The text is extracted with the `pdf_backend` (one of `PDF_TEXT_BACKENDS`). With pdftotext pdfplumber is only
+    opened when the text contains no DOI, to check the pdf metadata and any rotated text which pdftotext may garble.
 
     :param filename:
     :return:
     """
 
+    # The information dictionary and XMP metadata can usually be read straight from the bytes of the file. This avoids
+    # starting any external tools or parsing the document with pdfplumber when the DOI is in the metadata.
+    for value in pdf_metadata_strings(filename):
+        if resource_id := find_resource_id(value): return resource_id
+
     # First attempt to find a DOI in the file metadata. Quite a few publishers include the DOI as a keyword and
     # on macOS we can often find the URL the pdf was downloaded from via MDItemWhereFroms which may have the
     # DOI encoded. Searching file metadata is much faster than scraping the pdf below!
     if resource_id := find_resource_id_from_metadata(filename): return resource_id
 
+    search_text = True
+    if pdf_text_backend(pdf_backend) == 'pdftotext':
+        try:
+            pdf_pages = pdftotext_pages(filename, num_pages)
+        except FileNotFoundError: # if pdftotext is not found
+            pdf_pages = []
+        for pdf_text in pdf_pages:
+            if resource_id := find_resource_id(pdf_text): return resource_id
+        # The text only needs to be searched again with pdfplumber if pdftotext could not read the pdf
+        search_text = not pdf_pages
+
     if has_pdfplumber:
         with pdfplumber.open(filename) as pdf:
             # In modern PDFs the DOI of the document is often found in the pdf metadata. There's no standard for
@@ -280,14 +443,68 @@ def find_resource_id_from_pdf(filename, num_pages=2):
 
             # Check the first `num_pages` of text
             for page in pdf.pages[:min(num_pages, len(pdf.pages))]:
-                pdf_text = page.extract_text()
-                resource_id = find_resource_id(pdf_text)
-                if resource_id:
-                    return resource_id
-                resource_id = find_resource_id_from_chars(page.chars)
+                resource_id = find_resource_id_from_page(page, search_text=search_text)
                 if resource_id:
                     return resource_id
 
+def find_resource_ids_from_pdfs(filenames, jobs=1, scan_index=None, pdf_backend='auto'):
+    """
+    Return the resource id found by `find_resource_id_from_pdf` (or `None`) for each of the pdf `filenames` in order.
+
+    Files which are unchanged since they were last scanned are looked up in `scan_index` if it is given. Scraping a
+    pdf is CPU bound so with `jobs` > 1 the remaining files are scanned in a pool of worker processes rather than
+    threads, which lets a large library of pdfs use all cores.
+    """
+    resource_ids = {}
+    unscanned = []
+    for filename in dict.fromkeys(filenames):
+        if scan_index is not None:
+            found, resource_id = scan_index.lookup(filename)
+            if found:
+                resource_ids[filename] = resource_id
+                continue
+        unscanned.append(filename)
+
+    # Choose the backend once rather than for every file
+    scan = partial(find_resource_id_from_pdf, pdf_backend=pdf_text_backend(pdf_backend)) if unscanned else None
+    if jobs > 1 and len(unscanned) > 1:
+        # Worker processes exit without running atexit handlers, so their exiftool sessions are closed by a finalizer
+        workers = min(jobs, len(unscanned))
+        with ProcessPoolExecutor(max_workers=workers, initializer=close_exiftool_session_at_exit) as executor:
+            scanned = list(executor.map(scan, unscanned))
+    else:
+        scanned = [scan(filename) for filename in unscanned]
+
+    for filename, resource_id in zip(unscanned, scanned):
+        resource_ids[filename] = resource_id
+        if scan_index is not None:
+            scan_index.store(filename, resource_id)
+
+    return [resource_ids[filename] for filename in filenames]
+
+
+def is_pdf_file(filepath):
+    mimetype, _ = mimetypes.guess_type(filepath)
+    return (mimetype == 'application/pdf') or (mimetype == 'application/x-pdf')
+
+
+def files_in_directory(directory):
+    """
+    Return the pdf and text files in `directory` and all its subdirectories in sorted order. Hidden files and
+    directories are skipped.
+    """
+    filepaths = []
+    for root, dirnames, filenames in os.walk(directory):
+        dirnames[:] = sorted(dirname for dirname in dirnames if not dirname.startswith('.'))
+        for filename in sorted(filenames):
+            if filename.startswith('.'):
+                continue
+            filepath = os.path.join(root, filename)
+            if is_pdf_file(filepath) or (mimetypes.guess_type(filepath)[0] or '').startswith('text/'):
+                filepaths.append(filepath)
+    return filepaths
+
+
 def copy_to_clipboard(text):
     if sys.platform.startswith('darwin'):
         p = subprocess.Popen(['pbcopy'], stdin=subprocess.PIPE)
@@ -301,32 +518,64 @@ def copy_to_clipboard(text):
     #     raise RuntimeError(f"unsupported clipboard platform {sys.platform}")
 
 
-def resource_ids_from_args(items):
-    resource_id_list = []
+def resource_ids_from_args(items, jobs=1, use_scan_index=True, rescan=False, pdf_backend='auto', errors=None):
+    # Webpages which cannot be loaded while offline are skipped and their `OfflineError` stored in `errors` if it is
+    # given, in the same way as `OrcidProvider.request_merged`.
+    # The ids found for each item in order. Pdf files are only recorded by their position in `pdf_files` and scanned
+    # together afterwards so that up to `jobs` can be scanned at once.
+    found = []
+    pdf_files = []
 
     for item in items:
-        # check if the item is a file or a plain string
-        if os.path.isfile(os.path.expanduser(item)):
-            filepath = os.path.expanduser(item)
-            mimetype, _ = mimetypes.guess_type(filepath)
-            if (mimetype == 'application/pdf') or (mimetype == 'application/x-pdf'):
-                # file is a pdf file
-                if doi := find_resource_id_from_pdf(filepath):
-                    resource_id_list.append(doi)
-            else:
-                # assume file is a text file
-                with open(filepath) as f:
-                    for line in f:
-                        resource_ids = find_all_resource_ids(line)
-                        if resource_ids:
-                            resource_id_list += resource_ids
+        # check if the item is a directory, a file or a plain string
+        path = os.path.expanduser(item)
+        if os.path.isdir(path):
+            filepaths = files_in_directory(path)
+        elif os.path.isfile(path):
+            filepaths = [path]
+        else:
+            filepaths = None
+
+        if filepaths is not None:
+            for filepath in filepaths:
+                if is_pdf_file(filepath):
+                    found.append(len(pdf_files))
+                    pdf_files.append(filepath)
+                else:
+                    # assume file is a text file
+                    with open(filepath, errors='replace') as f:
+                        for line in f:
+                            resource_ids = find_all_resource_ids(line)
+                            if resource_ids:
+                                found.append(resource_ids)
 
         elif is_url(item):
-            if doi := doi_from_webpage_meta_data(item):
-                resource_id_list.append(doi)
+            try:
+                doi = doi_from_webpage_meta_data(item)
+            except OfflineError as error:
+                if errors is None:
+                    raise
+                errors[item] = error
+                continue
+            if doi:
+                found.append([doi])
         else:
             if resource_id := find_resource_id(item):
+                found.append([resource_id])
+
+    # With `rescan` every pdf is scanned again and the index is updated with the ids found
+    scan_index = ScanIndex(backend=pdf_backend, refresh=rescan) if use_scan_index and pdf_files else None
+    pdf_resource_ids = find_resource_ids_from_pdfs(
+        pdf_files, jobs=jobs, scan_index=scan_index, pdf_backend=pdf_backend
+    )
+
+    resource_id_list = []
+    for resource_ids in found:
+        if isinstance(resource_ids, int):
+            if resource_id := pdf_resource_ids[resource_ids]:
                 resource_id_list.append(resource_id)
+        else:
+            resource_id_list += resource_ids
 
     return resource_id_list
 
@@ -338,11 +587,37 @@ def append_result(results, text, output_format):
         results.append(text)
 
 
-def format_lookup_error(resource_id, output_format):
+def format_lookup_error(resource_id, output_format, error=None):
     resource_name = 'DOI' if resource_id.type == ResourceIdType.doi else 'arXiv'
+    if isinstance(error, OfflineError):
+        message = f'{resource_name} not in cache (offline): {resource_id.id}'
+    else:
+        message = f'failed {resource_name} lookup: {resource_id.id}'
+    return format_error_message(message, output_format)
+
+
+def format_orcid_error(orcid, output_format):
+    return format_error_message(f'ORCID works not in cache (offline): {orcid}', output_format)
+
+
+def format_webpage_error(url, output_format):
+    return format_error_message(f'webpage not in cache (offline): {url}', output_format)
+
+
+def format_error_message(message, output_format):
     if output_format in ('rtf', 'review'):
-        return rf'{{\pard \cf2 // failed {resource_name} lookup: {resource_id.id} \cf0 \par}}'
-    return f'\n// failed {resource_name} lookup: {resource_id.id}\n\n'
+        return rf'{{\pard \cf2 // {message} \cf0 \par}}'
+    return f'\n// {message}\n\n'
+
+
+def arxiv_id_for_resource(resource_id):
+    """Return the arXiv id used to resolve `resource_id`. Returns `None` if it is not resolved through arXiv."""
+    if resource_id.type == ResourceIdType.arxiv:
+        return resource_id.id
+    if resource_id.type == ResourceIdType.doi:
+        if arxiv_id := find_arxiv_id_from_doi(resource_id.id):
+            return arxiv_id.id
+    return None
 
 
 def resolve_resource_data(resource_id, doi_resolver, arxiv_resolver):
@@ -357,16 +632,209 @@ def resolve_resource_data(resource_id, doi_resolver, arxiv_resolver):
     raise ValueError(f"unsupported resource id type {resource_id.type}")
 
 
+def lookup_resource_data(resource_id, doi_resolver, arxiv_resolver, batched_data=None, errors=None):
+    """
+    Return the resolved data for `resource_id` or `None` if the lookup fails. `batched_data` optionally maps DOIs and
+    arXiv ids to results which have already been fetched with a provider's `request_many`. If an `errors` dictionary is
+    given the reason for a failed lookup is stored in it under the id.
+    """
+    try:
+        key = arxiv_id_for_resource(resource_id) or resource_id.id
+        if batched_data and key in batched_data:
+            if isinstance(batched_data[key], Exception):
+                raise batched_data[key]
+            return batched_data[key]
+        return resolve_resource_data(resource_id, doi_resolver, arxiv_resolver)
+    except (DoiTypeError, URLError) as error:
+        if errors is not None:
+            errors[resource_id.id] = error
+        return None
+
+
+def resolve_resource_list(resource_id_list, doi_resolver, arxiv_resolver, jobs=1, errors=None,
+                          strip_arxiv_version=False, refresh=None):
+    """
+    Resolve every id in `resource_id_list` and return the data in the same order as the input. Failed lookups are
+    returned as `None` and their errors stored in the optional `errors` dictionary (see `lookup_resource_data`). DOIs
+    in `refresh` are fetched again rather than taken from the cache, e.g. for ORCID works which have been modified.
+
+    Ids are put into canonical form (see `canonical_resource_id`) and each unique id is only looked up once, however
+    many times it occurs in the list. Every occurrence is given the same result.
+
+    When there is more than one DOI or arXiv id they are fetched up front with the providers' batched `request_many`
+    rather than one call per id. Lookups are dominated by network latency so with `jobs > 1` the Crossref batches are
+    spread over a pool of worker threads. arXiv asks clients to pause between API calls so its batches are always made
+    one after another.
+    """
+    canonical_id_list = [canonical_resource_id(resource_id, strip_arxiv_version) for resource_id in resource_id_list]
+    # ResourceId is not hashable so unique ids are keyed on their fields
+    unique_ids = list({(resource_id.id, resource_id.type): resource_id for resource_id in canonical_id_list}.values())
+
+    arxiv_ids = [arxiv_id for resource_id in unique_ids if (arxiv_id := arxiv_id_for_resource(resource_id))]
+    dois = [resource_id.id for resource_id in unique_ids
+            if resource_id.type == ResourceIdType.doi and not arxiv_id_for_resource(resource_id)]
+
+    refresh = {canonical_resource_id(ResourceId(doi, ResourceIdType.doi)).id for doi in refresh or ()}
+    refresh_dois = [doi for doi in dois if doi in refresh]
+    dois = [doi for doi in dois if doi not in refresh]
+
+    batched_data = {}
+    if len(arxiv_ids) > 1:
+        batched_data.update(zip(arxiv_ids, arxiv_resolver.request_many(arxiv_ids)))
+
+    batch_size = blib.providers.crossref_provider.CROSSREF_BATCH_SIZE
+    batches = []
+    if len(dois) > 1:
+        batches += [(dois[start:start + batch_size], True) for start in range(0, len(dois), batch_size)]
+    batches += [(refresh_dois[start:start + batch_size], False) for start in range(0, len(refresh_dois), batch_size)]
+
+    def request_batch(batch):
+        batch_dois, use_cache = batch
+        if use_cache:
+            return doi_resolver.request_many(batch_dois)
+        return doi_resolver.request_many(batch_dois, use_cache=False)
+
+    if batches:
+        with ThreadPoolExecutor(max_workers=min(jobs, len(batches))) as executor:
+            for (batch_dois, _), batch_data in zip(batches, executor.map(request_batch, batches)):
+                batched_data.update(zip(batch_dois, batch_data))
+
+    unique_errors = {}
+    unique_data = {
+        (resource_id.id, resource_id.type):
+            lookup_resource_data(resource_id, doi_resolver, arxiv_resolver, batched_data, unique_errors)
+        for resource_id in unique_ids
+    }
+
+    if errors is not None:
+        for resource_id, canonical_id in zip(resource_id_list, canonical_id_list):
+            if canonical_id.id in unique_errors:
+                errors[resource_id.id] = unique_errors[canonical_id.id]
+
+    return [unique_data[(resource_id.id, resource_id.type)] for resource_id in canonical_id_list]
+
+
+def print_stats(doi_resolver, arxiv_resolver, transport):
+    for name, provider in (('crossref', doi_resolver), ('arxiv', arxiv_resolver)):
+        memory_cache = provider.memory_cache
+        print(f'{name} memory cache: {memory_cache.hits} hits, {memory_cache.misses} misses', file=sys.stderr)
+
+    stats = transport.stats
+    saved = 1 - stats.wire_bytes / stats.decoded_bytes if stats.decoded_bytes else 0
+    print(f'network: {stats.responses} responses, {stats.wire_bytes} bytes on the wire, '
+          f'{stats.decoded_bytes} bytes decoded ({saved:.0%} saved by compression)', file=sys.stderr)
+
+
+def add_network_arguments(parser):
+    parser.add_argument('--jobs', type=is_positive_int,
+                        help='number of lookups and pdf scans to run concurrently',
+                        default=1)
+
+    parser.add_argument('--timeout', type=float,
+                        help='network timeout in seconds',
+                        default=blib.providers.transport.DEFAULT_TIMEOUT)
+
+    parser.add_argument('--retries', type=int,
+                        help='number of times to retry a lookup after a transient network error',
+                        default=3)
+
+
+def configure_network(args, offline=False):
+    # Keep a warm connection per host for each worker thread
+    configure_transport(
+        pool_size=max(args.jobs, blib.providers.transport.DEFAULT_POOL_SIZE),
+        timeout=args.timeout,
+        retry_policy=RetryPolicy(max_attempts=max(args.retries, 0) + 1),
+        offline=offline
+    )
+
+
+def add_orcid_filter_arguments(parser):
+    parser.add_argument('--since', type=partial_date,
+                        help='only include ORCID works published on or after this date (YYYY, YYYY-MM or YYYY-MM-DD)',
+                        default=None)
+
+    parser.add_argument('--until', type=partial_date,
+                        help='only include ORCID works published on or before this date (YYYY, YYYY-MM or YYYY-MM-DD)',
+                        default=None)
+
+    parser.add_argument('--limit', type=is_positive_int,
+                        help='only include the LIMIT most recent ORCID works',
+                        default=None)
+
+
+def prefetch(argv):
+    """
+    Fill the provider caches with every id found in the files, strings and ORCID works given in `argv`.
+
+    This is run with `blib prefetch ...` on a machine with network access so that later runs with `--offline` (for
+    example on build machines without network access) can resolve everything from the cache.
+    """
+    parser = argparse.ArgumentParser(
+        prog='blib prefetch',
+        description='Fetch entries for DOIs, files and ORCID iDs into the cache without printing them.'
+    )
+
+    parser.add_argument('items', nargs='*', help='a string, file or directory containing dois')
+
+    parser.add_argument('--orcid', type=orcid_list, action='extend',
+                        help='comma separated ORCID iDs in the format 0000-0000-0000-0000, may be repeated',
+                        default=[])
+
+    parser.add_argument('--strip-arxiv-version', action='store_true',
+                        help='treat arXiv ids which only differ in version as the same id')
+
+    add_orcid_filter_arguments(parser)
+
+    parser.add_argument('--pdf-backend', choices=PDF_TEXT_BACKENDS,
+                        help='program used to extract the text of pdf files, auto uses pdftotext if it is installed',
+                        default='auto')
+
+    add_network_arguments(parser)
+
+    args = parser.parse_args(argv)
+    if args.pdf_backend == 'pdftotext' and not pdftotext_available():
+        parser.error('--pdf-backend pdftotext requires pdftotext (from poppler) to be installed')
+    configure_network(args)
+
+    resource_id_list = resource_ids_from_args(args.items, jobs=args.jobs, pdf_backend=args.pdf_backend)
+    if args.orcid:
+        orcid_resolver = blib.providers.OrcidProvider(since=args.since, until=args.until, limit=args.limit)
+        resource_id_list += orcid_resolver.request_merged(args.orcid)
+
+    errors = {}
+    resource_data_list = resolve_resource_list(
+        resource_id_list, blib.providers.CrossrefProvider(), blib.providers.ArxivProvider(), jobs=args.jobs,
+        errors=errors, strip_arxiv_version=args.strip_arxiv_version
+    )
+
+    for resource_id, resource_data in zip(resource_id_list, resource_data_list):
+        if resource_data is None:
+            print(f'failed: {resource_id.id} ({errors.get(resource_id.id)})', file=sys.stderr)
+
+    cached = sum(resource_data is not None for resource_data in resource_data_list)
+    print(f'cached {cached} of {len(resource_id_list)} entries', file=sys.stderr)
+
+
 def main():
+    if sys.argv[1:2] == ['prefetch']:
+        return prefetch(sys.argv[2:])
+
     parser = argparse.ArgumentParser(
         description='Fetch bibliographic entries from DOIs or files.'
     )
 
-    parser.add_argument('items', nargs='*', help='a string containing a doi')
+    parser.add_argument('items', nargs='*', help='a string, file or directory containing a doi')
 
-    parser.add_argument('--orcid', type=is_valid_orcid,
-                        help='ORCID iD in the format 0000-0000-0000-0000',
-                        default=None)
+    parser.add_argument('--orcid', type=orcid_list, action='extend',
+                        help='comma separated ORCID iDs in the format 0000-0000-0000-0000, may be repeated',
+                        default=[])
+
+    parser.add_argument('--orcid-sync', action=argparse.BooleanOptionalAction,
+                        help='only refresh ORCID works which were modified since the last run',
+                        default=True)
+
+    add_orcid_filter_arguments(parser)
 
     parser.add_argument('--output',
                         choices=['md', 'bib', 'txt', 'rtf', 'review', 'doi', 'data'],
@@ -409,20 +877,75 @@ def main():
                         help='BibDesk autogeneration format string used by md/txt/rtf output',
                         default=None)
 
+    parser.add_argument('--strip-arxiv-version', action='store_true',
+                        help='treat arXiv ids which only differ in version as the same id')
+
+    add_network_arguments(parser)
+
+    parser.add_argument('--offline', action='store_true',
+                        help='only use cached entries and never access the network')
+
+    parser.add_argument('--stats', action='store_true',
+                        help='print cache and network statistics to stderr')
+
+    parser.add_argument('--select-fields', action=argparse.BooleanOptionalAction,
+                        help='only fetch the Crossref fields which are used rather than the full record',
+                        default=True)
+
+    parser.add_argument('--negative-cache', action=argparse.BooleanOptionalAction,
+                        help='reuse cached failures for DOIs which were not found or are not journal articles',
+                        default=True)
+
+    parser.add_argument('--scan-index', action=argparse.BooleanOptionalAction,
+                        help='reuse the ids found in pdf files which are unchanged since they were last scanned',
+                        default=True)
+
+    parser.add_argument('--rescan', action='store_true',
+                        help='scan every pdf file again and update the scan index with the ids found')
+
+    parser.add_argument('--pdf-backend', choices=PDF_TEXT_BACKENDS,
+                        help='program used to extract the text of pdf files, auto uses pdftotext if it is installed',
+                        default='auto')
 
     args = parser.parse_args()
+    if args.pdf_backend == 'pdftotext' and not pdftotext_available():
+        parser.error('--pdf-backend pdftotext requires pdftotext (from poppler) to be installed')
     if args.output and args.output_flag and args.output != args.output_flag:
         parser.error('--output cannot be combined with a different output flag')
 
     args.output = args.output_flag or args.output or 'bib'
+
+    configure_network(args, offline=args.offline)
+
     markdown_use_title = False if args.title is None else args.title
     standard_use_title = True if args.title is None else args.title
 
+    orcid_resolver = None
+    orcid_errors = {}
+    webpage_errors = {}
     if args.orcid:
-        orcid_resolver = blib.providers.OrcidProvider()
-        resource_id_list = orcid_resolver.request(args.orcid)
+        orcid_resolver = blib.providers.OrcidProvider(
+            sync=args.orcid_sync, since=args.since, until=args.until, limit=args.limit
+        )
+        if len(args.orcid) == 1:
+            try:
+                resource_id_list = orcid_resolver.request(args.orcid[0])
+            except OfflineError as error:
+                orcid_errors[args.orcid[0]] = error
+                resource_id_list = []
+        else:
+            resource_id_list = orcid_resolver.request_merged(args.orcid, errors=orcid_errors)
     else:
-        resource_id_list = resource_ids_from_args(args.items)
+        resource_id_list = resource_ids_from_args(
+            args.items, jobs=args.jobs, use_scan_index=args.scan_index, rescan=args.rescan,
+            pdf_backend=args.pdf_backend, errors=webpage_errors
+        )
+
+    # Works which were modified on ORCID since the last sync may have new metadata so they are not taken from the cache.
+    # New works, which includes every work on the first sync, are resolved through the cache as usual so that a warm
+    # (e.g. prefetched) cache is used. Nothing can be refetched while offline, so the snapshot is not advanced either.
+    orcid_sync = orcid_resolver is not None and args.orcid_sync and not args.offline
+    refresh = orcid_resolver.changed_dois() if orcid_sync else set()
 
     if args.output == 'bib':
         formatter = BibtexFormatter(
@@ -463,20 +986,48 @@ def main():
             abbreviate_journals=args.abbrev
         )
 
-    doi_resolver = blib.providers.CrossrefProvider()
+    doi_resolver = blib.providers.CrossrefProvider(
+        use_negative_cache=args.negative_cache, use_select=args.select_fields
+    )
     arxiv_resolver = blib.providers.ArxivProvider()
 
+    errors = {}
+    resource_data_list = resolve_resource_list(
+        resource_id_list, doi_resolver, arxiv_resolver, jobs=args.jobs, errors=errors,
+        strip_arxiv_version=args.strip_arxiv_version, refresh=refresh
+    )
+
+    if orcid_sync:
+        # Works whose lookup failed are compared with the old snapshot again, and refetched, on the next run
+        orcid_resolver.commit_snapshot(
+            resource_id.id for resource_id, resource_data in zip(resource_id_list, resource_data_list)
+            if resource_data is not None
+        )
+
     results = [formatter.header()]
-    for resource_id in resource_id_list:
-        try:
-            text = formatter.format(resolve_resource_data(resource_id, doi_resolver, arxiv_resolver))
-            if text:
-                append_result(results, text, args.output)
-        except (DoiTypeError, URLError):
-            append_result(results, format_lookup_error(resource_id, args.output), args.output)
+    for orcid in orcid_errors:
+        append_result(results, format_orcid_error(orcid, args.output), args.output)
+    for url in webpage_errors:
+        append_result(results, format_webpage_error(url, args.output), args.output)
+
+    for resource_id, resource_data in zip(resource_id_list, resource_data_list):
+        if resource_data is None:
+            error = errors.get(resource_id.id)
+            append_result(results, format_lookup_error(resource_id, args.output, error), args.output)
+            continue
+
+        text = formatter.format(resource_data)
+        if text:
+            append_result(results, text, args.output)
 
     results.append(formatter.footer())
 
+    if args.stats:
+        print_stats(doi_resolver, arxiv_resolver, default_transport())
+        if orcid_resolver and args.orcid_sync:
+            print(f'orcid sync: {len(orcid_resolver.new_dois())} new, {len(orcid_resolver.changed_dois())} changed, '
+                  f'{orcid_resolver.unchanged_count()} unchanged works', file=sys.stderr)
+
     if args.clip:
         copy_to_clipboard(''.join(results))
 
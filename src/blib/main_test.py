@@ -1,18 +1,57 @@
+import argparse
 import io
-from urllib.error import URLError
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+from urllib.error import HTTPError, URLError
 from unittest import TestCase
 from unittest.mock import MagicMock, Mock, patch
 
+from blib.exiftool import close_exiftool_session_at_exit
 from blib.main import (
+    doi_candidates,
+    doi_from_webpage_meta_data,
     find_arxiv_id_from_doi,
     find_resource_id_from_chars,
+    find_resource_id_from_pdf,
     is_valid_orcid,
     main,
+    partial_date,
+    process_doi_string,
+    resource_ids_from_args,
     resolve_resource_data,
+    resolve_resource_list,
 )
+from blib.providers.transport import HttpResponse, OfflineError
 from blib.resourceid import ResourceId, ResourceIdType
 
 
+def pdf_with_text(lines, width=612, height=792):
+    """Return the bytes of a one page pdf with each of the `lines` (x, y, text) written on it."""
+    content = b''.join(b'BT /F1 10 Tf %d %d Td (%s) Tj ET\n' % (x, y, text.encode('latin-1')) for x, y, text in lines)
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents 4 0 R '
+        b'/Resources << /Font << /F1 5 0 R >> >> >>' % (width, height),
+        b'<< /Length %d >>\nstream\n%sendstream' % (len(content), content),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    pdf = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(pdf)
+    pdf += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    pdf += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    pdf += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return pdf
+
+
 class TestMain(TestCase):
     def test_is_valid_orcid_accepts_expected_format(self):
         self.assertEqual(is_valid_orcid('0000-0003-4843-5516'), '0000-0003-4843-5516')
@@ -243,3 +282,514 @@ class TestMain(TestCase):
             find_resource_id_from_chars(chars),
             ResourceId("2206.05264v1", ResourceIdType.arxiv),
         )
+
+    def test_resolve_resource_list_keeps_input_order_with_concurrent_jobs(self):
+        delays = {'10.1000/slow': 0.05, '10.1000/bad': 0.02, '10.1000/fast': 0.0}
+
+        def request_many(dois):
+            time.sleep(delays[dois[0]])
+            if dois == ['10.1000/bad']:
+                return [URLError('not found')]
+            return [{'doi': doi} for doi in dois]
+
+        doi_resolver = Mock()
+        doi_resolver.request_many.side_effect = request_many
+
+        with patch('blib.providers.crossref_provider.CROSSREF_BATCH_SIZE', 1):
+            result = resolve_resource_list(
+                [
+                    ResourceId('10.1000/slow', ResourceIdType.doi),
+                    ResourceId('10.1000/bad', ResourceIdType.doi),
+                    ResourceId('10.1000/fast', ResourceIdType.doi),
+                ],
+                doi_resolver,
+                Mock(),
+                jobs=3,
+            )
+
+        self.assertEqual(result, [{'doi': '10.1000/slow'}, None, {'doi': '10.1000/fast'}])
+        self.assertEqual(doi_resolver.request_many.call_count, 3)
+        doi_resolver.request.assert_not_called()
+
+    def test_jobs_option_writes_entries_in_input_order(self):
+        def request_many(dois):
+            return [URLError('not found') if doi == '10.1000/bad' else {'doi': doi} for doi in dois]
+
+        doi_resolver = Mock()
+        doi_resolver.request_many.side_effect = request_many
+
+        with patch('sys.argv', ['blib', '--doi', '--no-clip', '--jobs', '4',
+                                '10.1000/a', '10.1000/bad', '10.1000/b']), \
+             patch('blib.main.blib.providers.CrossrefProvider', return_value=doi_resolver), \
+             patch('blib.main.blib.providers.ArxivProvider'), \
+             patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            main()
+
+        output = stdout.getvalue()
+
+        self.assertLess(output.find('10.1000/a'), output.find('// failed DOI lookup: 10.1000/bad'))
+        self.assertLess(output.find('// failed DOI lookup: 10.1000/bad'), output.rfind('10.1000/b\n'))
+
+    def test_resolve_resource_list_batches_arxiv_lookups(self):
+        arxiv_resolver = Mock()
+        arxiv_resolver.request_many.return_value = [{'eprint': '2101.00001'}, URLError('not found')]
+        doi_resolver = Mock()
+        doi_resolver.request.return_value = {'doi': '10.1000/a'}
+
+        result = resolve_resource_list(
+            [
+                ResourceId('2101.00001', ResourceIdType.arxiv),
+                ResourceId('10.1000/a', ResourceIdType.doi),
+                ResourceId('10.48550/arXiv.2101.00002', ResourceIdType.doi),
+            ],
+            doi_resolver,
+            arxiv_resolver,
+        )
+
+        self.assertEqual(result, [{'eprint': '2101.00001'}, {'doi': '10.1000/a'}, None])
+        arxiv_resolver.request_many.assert_called_once_with(['2101.00001', '2101.00002'])
+        arxiv_resolver.request.assert_not_called()
+
+    def test_offline_option_reports_cache_misses_per_id(self):
+        doi_resolver = MagicMock()
+        doi_resolver.request.side_effect = OfflineError('not fetching while offline')
+
+        with patch('sys.argv', ['blib', '--doi', '--no-clip', '--offline', '10.1000/a']), \
+             patch('blib.main.configure_transport') as configure_transport, \
+             patch('blib.main.blib.providers.CrossrefProvider', return_value=doi_resolver), \
+             patch('blib.main.blib.providers.ArxivProvider'), \
+             patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            main()
+
+        self.assertTrue(configure_transport.call_args.kwargs['offline'])
+        self.assertIn('// DOI not in cache (offline): 10.1000/a', stdout.getvalue())
+
+    def test_offline_option_reports_orcid_works_missing_from_cache(self):
+        with patch('sys.argv', ['blib', '--doi', '--no-clip', '--offline', '--orcid', '0000-0003-4843-5516']), \
+             patch('blib.providers.orcid_provider.provider_cache', return_value={}), \
+             patch('blib.main.blib.providers.CrossrefProvider'), \
+             patch('blib.main.blib.providers.ArxivProvider'), \
+             patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            main()
+
+        self.assertIn('// ORCID works not in cache (offline): 0000-0003-4843-5516', stdout.getvalue())
+
+    def test_offline_option_reports_webpages_which_cannot_be_loaded(self):
+        with patch('sys.argv', ['blib', '--doi', '--no-clip', '--offline', 'https://example.org/paper']), \
+             patch('blib.main.blib.providers.CrossrefProvider'), \
+             patch('blib.main.blib.providers.ArxivProvider'), \
+             patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            main()
+
+        self.assertIn('// webpage not in cache (offline): https://example.org/paper', stdout.getvalue())
+
+    def test_orcid_works_prefetched_into_the_cache_resolve_offline(self):
+        orcid = '0000-0002-1825-0097'
+        dois = ['10.5555/prefetched-a', '10.5555/prefetched-b']
+        works = json.dumps({'group': [{
+            'external-ids': {'external-id': [{'external-id-type': 'doi', 'external-id-value': doi}]},
+            'work-summary': [{'put-code': put_code, 'last-modified-date': {'value': 1700000000000}}],
+        } for put_code, doi in enumerate(dois)]}).encode('utf-8')
+        items = json.dumps({'status': 'ok', 'message': {'items': [{
+            'DOI': doi, 'type': 'journal-article', 'title': ['A title'],
+            'author': [{'given': 'Ada', 'family': 'Lovelace'}], 'container-title': ['Journal'],
+            'published-print': {'date-parts': [[2024]]},
+        } for doi in dois]}}).encode('utf-8')
+
+        def get_with_redirects(url, headers):
+            body = works if url.startswith('https://pub.orcid.org/') else items
+            return HttpResponse(url=url, status=200, headers=Message(), body=body)
+
+        # Both runs share the (temporary) cache of the test session
+        with patch('blib.providers.transport.HttpTransport._get_with_redirects', side_effect=get_with_redirects), \
+             patch('sys.argv', ['blib', 'prefetch', '--orcid', orcid]), \
+             patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            main()
+        self.assertIn('cached 2 of 2 entries', stderr.getvalue())
+
+        with patch('sys.argv', ['blib', '--doi', '--no-clip', '--offline', '--orcid', orcid]), \
+             patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            main()
+
+        self.assertNotIn('not in cache', stdout.getvalue())
+        for doi in dois:
+            self.assertIn(doi, stdout.getvalue())
+
+    def test_orcid_works_whose_refetch_failed_are_refetched_on_the_next_sync(self):
+        orcid = '0000-0002-1825-0018'
+        dois = ['10.5555/sync-a', '10.5555/sync-b']
+        last_modified = {doi: 100 for doi in dois}
+        crossref_available = True
+
+        def get_with_redirects(url, headers):
+            if url.startswith('https://pub.orcid.org/'):
+                body = json.dumps({'group': [{
+                    'last-modified-date': {'value': last_modified[doi]},
+                    'external-ids': {'external-id': [{'external-id-type': 'doi', 'external-id-value': doi}]},
+                    'work-summary': [{'put-code': put_code}],
+                } for put_code, doi in enumerate(dois)]}).encode('utf-8')
+            elif crossref_available:
+                body = json.dumps({'status': 'ok', 'message': {'items': [{
+                    'DOI': doi, 'type': 'journal-article', 'title': ['A title'],
+                    'author': [{'given': 'Ada', 'family': 'Lovelace'}], 'container-title': ['Journal'],
+                    'published-print': {'date-parts': [[2024]]},
+                } for doi in dois]}}).encode('utf-8')
+            else:
+                raise HTTPError(url, 404, 'Not Found', Message(), None)
+            return HttpResponse(url=url, status=200, headers=Message(), body=body)
+
+        def sync():
+            with patch('sys.argv', ['blib', '--doi', '--no-clip', '--stats', '--orcid', orcid]), \
+                 patch('sys.stdout', new_callable=io.StringIO) as stdout, \
+                 patch('sys.stderr', new_callable=io.StringIO) as stderr:
+                main()
+            return stdout.getvalue(), stderr.getvalue()
+
+        # Every run shares the (temporary) cache of the test session
+        with patch('blib.providers.transport.HttpTransport._get_with_redirects', side_effect=get_with_redirects):
+            sync()
+            last_modified['10.5555/sync-b'] = 200
+            crossref_available = False
+            output, _ = sync()
+            self.assertIn('// failed DOI lookup: 10.5555/sync-b', output)
+
+            crossref_available = True
+            _, stats = sync()
+            self.assertIn('orcid sync: 0 new, 1 changed, 1 unchanged works', stats)
+            _, stats = sync()
+            self.assertIn('orcid sync: 0 new, 0 changed, 2 unchanged works', stats)
+
+    def test_prefetch_subcommand_fills_cache_and_reports_counts(self):
+        def request_many(dois):
+            return [URLError('not found') if doi == '10.1000/bad' else {'doi': doi} for doi in dois]
+
+        doi_resolver = Mock()
+        doi_resolver.request_many.side_effect = request_many
+
+        with patch('sys.argv', ['blib', 'prefetch', '--jobs', '2', '10.1000/a', '10.1000/bad']), \
+             patch('blib.main.blib.providers.CrossrefProvider', return_value=doi_resolver), \
+             patch('blib.main.blib.providers.ArxivProvider'), \
+             patch('sys.stdout', new_callable=io.StringIO) as stdout, \
+             patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            main()
+
+        doi_resolver.request_many.assert_called_once_with(['10.1000/a', '10.1000/bad'])
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertIn('failed: 10.1000/bad', stderr.getvalue())
+        self.assertIn('cached 1 of 2 entries', stderr.getvalue())
+
+    def test_resolve_resource_list_looks_up_each_canonical_id_once(self):
+        def request_many(dois):
+            return [{'doi': doi} for doi in dois]
+
+        doi_resolver = Mock()
+        doi_resolver.request_many.side_effect = request_many
+        arxiv_resolver = Mock()
+        arxiv_resolver.request_many.return_value = [{'eprint': '2101.00001'}]
+        arxiv_resolver.request.return_value = {'eprint': '2101.00001'}
+
+        with patch('blib.main.blib.providers.crossref_provider.CROSSREF_BATCH_SIZE', 1):
+            result = resolve_resource_list(
+                [
+                    ResourceId('10.1000/A', ResourceIdType.doi),
+                    ResourceId('https://doi.org/10.1000/a', ResourceIdType.doi),
+                    ResourceId('10.1000/b', ResourceIdType.doi),
+                    ResourceId('2101.00001v1', ResourceIdType.arxiv),
+                    ResourceId('10.48550/arXiv.2101.00001v2', ResourceIdType.doi),
+                    ResourceId('10.1000/a', ResourceIdType.doi),
+                ],
+                doi_resolver,
+                arxiv_resolver,
+                jobs=4,
+                strip_arxiv_version=True,
+            )
+
+        self.assertEqual(
+            result,
+            [{'doi': '10.1000/a'}, {'doi': '10.1000/a'}, {'doi': '10.1000/b'},
+             {'eprint': '2101.00001'}, {'eprint': '2101.00001'}, {'doi': '10.1000/a'}],
+        )
+        self.assertCountEqual(
+            [call.args[0] for call in doi_resolver.request_many.call_args_list], [['10.1000/a'], ['10.1000/b']]
+        )
+        arxiv_resolver.request_many.assert_not_called()
+        arxiv_resolver.request.assert_called_once_with('2101.00001')
+
+    def test_repeated_ids_are_listed_for_every_occurrence(self):
+        doi_resolver = MagicMock()
+        doi_resolver.request.side_effect = URLError('not found')
+
+        with patch('sys.argv', ['blib', '--doi', '--no-clip', '10.1000/Bad', 'doi:10.1000/bad']), \
+             patch('blib.main.blib.providers.CrossrefProvider', return_value=doi_resolver), \
+             patch('blib.main.blib.providers.ArxivProvider'), \
+             patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            main()
+
+        doi_resolver.request.assert_called_once_with('10.1000/bad')
+        self.assertIn('// failed DOI lookup: 10.1000/Bad', stdout.getvalue())
+        self.assertIn('// failed DOI lookup: 10.1000/bad', stdout.getvalue())
+
+    def test_doi_candidates_are_ordered_from_longest_to_shortest(self):
+        self.assertEqual(
+            doi_candidates('https://iopscience.iop.org/article/10.1088/0953-8984/28/47/476007/meta'),
+            ['10.1088/0953-8984/28/47/476007/meta', '10.1088/0953-8984/28/47/476007', '10.1088/0953-8984/28/47',
+             '10.1088/0953-8984/28', '10.1088/0953-8984'],
+        )
+
+    def test_process_doi_string_checks_all_candidates_in_one_request(self):
+        body = json.dumps({'message': {'items': [
+            {'DOI': '10.1088/0953-8984/28'},
+            {'DOI': '10.1088/0953-8984/28/47/476007'},
+        ]}}).encode('utf-8')
+        transport = Mock()
+        transport.get.return_value = HttpResponse(url='', status=200, headers=Message(), body=body)
+
+        with patch('blib.main.default_transport', return_value=transport):
+            entry = process_doi_string('https://iopscience.iop.org/article/10.1088/0953-8984/28/47/476007/meta')
+
+        self.assertEqual(entry, {'DOI': '10.1088/0953-8984/28/47/476007'})
+        transport.get.assert_called_once()
+        self.assertIn('filter=doi:10.1088/0953-8984/28/47/476007/meta,doi:', transport.get.call_args.args[0])
+
+    def test_process_doi_string_probes_candidates_when_filter_query_fails(self):
+        def get(url, headers=None):
+            if url == 'https://api.crossref.org/works/10.1000/a/b':
+                return HttpResponse(url=url, status=200, headers=Message(), body=b'{"message": {"DOI": "10.1000/a/b"}}')
+            raise URLError('not found')
+
+        transport = Mock()
+        transport.get.side_effect = get
+
+        with patch('blib.main.default_transport', return_value=transport):
+            entry = process_doi_string('10.1000/a/b/c')
+
+        self.assertEqual(entry, {'DOI': '10.1000/a/b'})
+        self.assertEqual(transport.get.call_count, 4)
+
+    def test_stats_option_reports_cache_hits_and_bytes_saved(self):
+        doi_resolver = MagicMock()
+        doi_resolver.request.return_value = {'doi': '10.1000/a'}
+        doi_resolver.memory_cache.hits, doi_resolver.memory_cache.misses = 2, 1
+        transport = Mock()
+        transport.stats.responses, transport.stats.wire_bytes, transport.stats.decoded_bytes = 1, 250, 1000
+
+        with patch('sys.argv', ['blib', '--doi', '--no-clip', '--stats', '10.1000/a']), \
+             patch('blib.main.blib.providers.CrossrefProvider', return_value=doi_resolver), \
+             patch('blib.main.blib.providers.ArxivProvider'), \
+             patch('blib.main.default_transport', return_value=transport), \
+             patch('sys.stdout', new_callable=io.StringIO), \
+             patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            main()
+
+        self.assertIn('crossref memory cache: 2 hits, 1 misses', stderr.getvalue())
+        self.assertIn('250 bytes on the wire, 1000 bytes decoded (75% saved by compression)', stderr.getvalue())
+
+    def test_multiple_orcids_are_merged_into_one_list(self):
+        orcid_resolver = MagicMock()
+        orcid_resolver.request_merged.return_value = [ResourceId('10.1000/a', ResourceIdType.doi)]
+        doi_resolver = MagicMock()
+        doi_resolver.request.return_value = {'doi': '10.1000/a'}
+
+        with patch('sys.argv', ['blib', '--doi', '--no-clip', '--orcid', '0000-0000-0000-0001,0000-0000-0000-0002',
+                                '--orcid', '0000-0000-0000-0003']), \
+             patch('blib.main.blib.providers.OrcidProvider', return_value=orcid_resolver), \
+             patch('blib.main.blib.providers.CrossrefProvider', return_value=doi_resolver), \
+             patch('blib.main.blib.providers.ArxivProvider'), \
+             patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            main()
+
+        orcid_resolver.request_merged.assert_called_once_with(
+            ['0000-0000-0000-0001', '0000-0000-0000-0002', '0000-0000-0000-0003'], errors={})
+        orcid_resolver.request.assert_not_called()
+        self.assertIn('10.1000/a', stdout.getvalue())
+
+    def test_orcid_date_filters_are_passed_to_the_provider(self):
+        orcid_resolver = MagicMock()
+        orcid_resolver.request.return_value = []
+
+        with patch('sys.argv', ['blib', '--doi', '--no-clip', '--orcid', '0000-0003-4843-5516',
+                                '--since', '2020', '--until', '2024-06', '--limit', '5']), \
+             patch('blib.main.blib.providers.OrcidProvider', return_value=orcid_resolver) as orcid_provider, \
+             patch('blib.main.blib.providers.CrossrefProvider'), \
+             patch('blib.main.blib.providers.ArxivProvider'), \
+             patch('sys.stdout', new_callable=io.StringIO):
+            main()
+
+        orcid_provider.assert_called_once_with(
+            sync=True, since=(2020, None, None), until=(2024, 6, None), limit=5)
+
+    def test_partial_date_parses_year_month_and_day(self):
+        self.assertEqual(partial_date('2021'), (2021, None, None))
+        self.assertEqual(partial_date('2021-03'), (2021, 3, None))
+        self.assertEqual(partial_date('2021-03-09'), (2021, 3, 9))
+        for value in ('21', '2021-13', '2021/03', '2021-03-09-01'):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                partial_date(value)
+
+    def test_pdfs_are_scanned_in_a_pool_and_ids_keep_the_input_order(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for name in ('a.pdf', 'b.pdf', 'c.pdf'):
+                paths.append(os.path.join(directory, name))
+                open(paths[-1], 'w').close()
+
+            pdf_ids = {
+                paths[0]: ResourceId('10.1000/a', ResourceIdType.doi),
+                paths[2]: ResourceId('10.1000/c', ResourceIdType.doi),
+            }
+            with patch('blib.main.find_resource_id_from_pdf',
+                       side_effect=lambda path, pdf_backend: pdf_ids.get(path)), \
+                 patch('blib.main.ProcessPoolExecutor', wraps=ThreadPoolExecutor) as executor:
+                resource_ids = resource_ids_from_args(
+                    [paths[0], '10.1000/b', paths[1], paths[2]], jobs=4, use_scan_index=False)
+
+        executor.assert_called_once_with(max_workers=3, initializer=close_exiftool_session_at_exit)
+        self.assertEqual([resource_id.id for resource_id in resource_ids], ['10.1000/a', '10.1000/b', '10.1000/c'])
+
+    def test_directories_are_scanned_recursively_for_pdf_and_text_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.makedirs(os.path.join(directory, 'b', 'c'))
+            os.makedirs(os.path.join(directory, '.hidden'))
+            files = {
+                'a.pdf': b'', 'b/references.txt': b'10.1000/b\n', 'b/c/c.pdf': b'', 'b/image.png': b'10.1000/png',
+                '.hidden/d.txt': b'10.1000/hidden',
+            }
+            for name, contents in files.items():
+                with open(os.path.join(directory, name), 'wb') as f:
+                    f.write(contents)
+
+            def find_pdf_id(filename, pdf_backend):
+                return ResourceId('10.1000/' + os.path.basename(filename)[0], ResourceIdType.doi)
+
+            with patch('blib.main.find_resource_id_from_pdf', side_effect=find_pdf_id):
+                resource_ids = resource_ids_from_args([directory], use_scan_index=False)
+
+        self.assertEqual([resource_id.id for resource_id in resource_ids], ['10.1000/a', '10.1000/b', '10.1000/c'])
+
+    def test_pdfs_in_the_scan_index_are_not_scanned_again(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'paper.pdf')
+            with open(path, 'wb') as f:
+                f.write(b'%PDF-1.4')
+
+            with patch('blib.scanindex.provider_cache', return_value={}), \
+                 patch('blib.main.find_resource_id_from_pdf',
+                       return_value=ResourceId('10.1000/a', ResourceIdType.doi)) as find_pdf_id:
+                first = resource_ids_from_args([path], pdf_backend='pdfplumber')
+                second = resource_ids_from_args([directory], pdf_backend='pdfplumber')
+
+        self.assertEqual(first, second)
+        find_pdf_id.assert_called_once_with(path, pdf_backend='pdfplumber')
+
+    def test_rescan_scans_indexed_pdfs_again_and_updates_the_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'paper.pdf')
+            with open(path, 'wb') as f:
+                f.write(b'%PDF-1.4')
+
+            with patch('blib.scanindex.provider_cache', return_value={}), \
+                 patch('blib.main.find_resource_id_from_pdf',
+                       side_effect=[None, ResourceId('10.1000/a', ResourceIdType.doi)]) as find_pdf_id:
+                first = resource_ids_from_args([path], pdf_backend='pdfplumber')
+                rescanned = resource_ids_from_args([path], rescan=True, pdf_backend='pdfplumber')
+                second = resource_ids_from_args([path], pdf_backend='pdfplumber')
+
+        self.assertEqual(first, [])
+        self.assertEqual(rescanned, [ResourceId('10.1000/a', ResourceIdType.doi)])
+        self.assertEqual(second, rescanned)
+        self.assertEqual(find_pdf_id.call_count, 2)
+
+    def test_pdf_metadata_is_read_without_starting_external_tools(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'paper.pdf')
+            with open(path, 'wb') as f:
+                f.write(b'%PDF-1.4\n1 0 obj\n<< /Subject (doi:10.1000/a) >>\nendobj\ntrailer\n<< /Info 1 0 R >>\n')
+
+            with patch('blib.main.find_resource_id_from_metadata') as find_in_metadata, \
+                 patch('blib.main.pdftotext_pages') as pages:
+                resource_id = find_resource_id_from_pdf(path)
+
+        self.assertEqual(resource_id, ResourceId('10.1000/a', ResourceIdType.doi))
+        find_in_metadata.assert_not_called()
+        pages.assert_not_called()
+
+    def test_pdf_header_and_footer_are_searched_before_the_whole_page(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'paper.pdf')
+            with open(path, 'wb') as f:
+                f.write(pdf_with_text([(72, 400, 'See doi:10.1000/body'), (72, 40, 'doi:10.1000/footer')]))
+
+            with patch('blib.main.find_resource_id_from_metadata', return_value=None):
+                resource_id = find_resource_id_from_pdf(path, pdf_backend='pdfplumber')
+
+        self.assertEqual(resource_id, ResourceId('10.1000/footer', ResourceIdType.doi))
+
+    def test_whole_pdf_page_is_searched_when_regions_have_no_id(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'paper.pdf')
+            with open(path, 'wb') as f:
+                f.write(pdf_with_text([(72, 400, 'See doi:10.1000/body'), (72, 40, 'Page 1')]))
+
+            with patch('blib.main.find_resource_id_from_metadata', return_value=None):
+                resource_id = find_resource_id_from_pdf(path, pdf_backend='pdfplumber')
+
+        self.assertEqual(resource_id, ResourceId('10.1000/body', ResourceIdType.doi))
+
+    def test_pdftotext_backend_finds_ids_without_opening_pdfplumber(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'paper.pdf')
+            with open(path, 'wb') as f:
+                f.write(pdf_with_text([(72, 400, 'Page 1')]))
+
+            with patch('blib.main.find_resource_id_from_metadata', return_value=None), \
+                 patch('blib.main.pdftotext_pages', return_value=['Page 1', 'doi:10.1000/a']) as pages, \
+                 patch('blib.main.pdfplumber.open') as pdfplumber_open:
+                resource_id = find_resource_id_from_pdf(path, pdf_backend='pdftotext')
+
+        self.assertEqual(resource_id, ResourceId('10.1000/a', ResourceIdType.doi))
+        pages.assert_called_once_with(path, 2)
+        pdfplumber_open.assert_not_called()
+
+    def test_pdfplumber_only_searches_rotated_text_after_pdftotext(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'paper.pdf')
+            with open(path, 'wb') as f:
+                f.write(pdf_with_text([(72, 400, 'See doi:10.1000/body')]))
+
+            with patch('blib.main.find_resource_id_from_metadata', return_value=None), \
+                 patch('blib.main.pdftotext_pages', return_value=['']), \
+                 patch('blib.main.find_resource_id_from_page', return_value=None) as find_in_page:
+                find_resource_id_from_pdf(path, pdf_backend='pdftotext')
+
+        self.assertFalse(find_in_page.call_args.kwargs['search_text'])
+
+    def test_pdfplumber_searches_the_text_when_pdftotext_cannot_read_the_pdf(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'paper.pdf')
+            with open(path, 'wb') as f:
+                f.write(pdf_with_text([(72, 400, 'See doi:10.1000/body')]))
+
+            with patch('blib.main.find_resource_id_from_metadata', return_value=None), \
+                 patch('blib.main.pdftotext_pages', return_value=[]):
+                resource_id = find_resource_id_from_pdf(path, pdf_backend='pdftotext')
+
+        self.assertEqual(resource_id, ResourceId('10.1000/body', ResourceIdType.doi))
+
+    def test_resolve_resource_list_refetches_dois_to_refresh(self):
+        doi_resolver = Mock()
+        doi_resolver.request_many.side_effect = lambda dois, use_cache=True: [
+            {'doi': doi, 'cached': use_cache} for doi in dois]
+
+        result = resolve_resource_list(
+            [ResourceId('10.1000/a', ResourceIdType.doi), ResourceId('10.1000/b', ResourceIdType.doi),
+             ResourceId('10.1000/c', ResourceIdType.doi)],
+            doi_resolver,
+            Mock(),
+            refresh={'10.1000/B'},
+        )
+
+        self.assertEqual([data['cached'] for data in result], [True, False, True])
+        doi_resolver.request_many.assert_any_call(['10.1000/b'], use_cache=False)
+
+    def test_doi_from_webpage_meta_data_ignores_strings_which_are_not_urls(self):
+        self.assertIsNone(doi_from_webpage_meta_data('not a url'))
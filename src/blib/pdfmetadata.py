@@ -0,0 +1,173 @@
+import codecs
+import html
+import mmap
+import re
+
+# Give up looking for an object after this many false matches
+MAX_SEARCH_ATTEMPTS = 32
+
+_INFO_REFERENCE_REGEX = re.compile(rb'/Info\s*(\d+)\s+(\d+)\s+R')
+_TOKEN_REGEX = re.compile(rb'\(|(?<!<)<(?!<)|(\d+)\s+(\d+)\s+R(?![A-Za-z])')
+_LITERAL_STRING_ESCAPES = {
+    ord('n'): b'\n', ord('r'): b'\r', ord('t'): b'\t', ord('b'): b'\b', ord('f'): b'\f',
+    ord('('): b'(', ord(')'): b')', ord('\\'): b'\\',
+}
+
+
+def pdf_metadata_strings(filename):
+    """
+    Return the string values of the document information dictionary and the XMP metadata packets of a pdf.
+
+    This reads the raw bytes of the file (memory mapped) rather than parsing the document, so it is much faster than
+    opening the pdf with pdfplumber. Only the information dictionary referenced by the last trailer is read, and only
+    if it is stored as a plain object. Metadata inside compressed object streams or encrypted documents is not found,
+    in which case an empty list (or only the XMP packets) is returned.
+    """
+    try:
+        with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _info_strings(data) + _xmp_packets(data)
+    except (OSError, ValueError):
+        # ValueError is raised when mapping an empty file
+        return []
+
+
+def _xmp_packets(data):
+    packets = []
+    start = data.find(b'<rdf:RDF')
+    while start != -1:
+        end = data.find(b'</rdf:RDF>', start)
+        if end == -1:
+            break
+        packets.append(html.unescape(data[start:end].decode('utf-8', errors='replace')))
+        start = data.find(b'<rdf:RDF', end)
+    return packets
+
+
+def _info_strings(data):
+    reference = _info_reference(data)
+    if reference is None:
+        return []
+
+    body = _object_body(data, *reference)
+    if body is None:
+        return []
+
+    strings = []
+    for value in _dictionary_values(body):
+        if isinstance(value, tuple):
+            # Values may be stored in a separate object
+            value_body = _object_body(data, *value)
+            value = next(iter(_dictionary_values(value_body)), None) if value_body is not None else None
+            if not isinstance(value, bytes):
+                continue
+        strings.append(_decode_pdf_string(value))
+    return strings
+
+
+def _info_reference(data):
+    """Return the (object number, generation) of the information dictionary in the last trailer of the pdf."""
+    # Newer revisions of a pdf are appended to the file, so the last trailer (or cross-reference stream) is current
+    end = len(data)
+    for _ in range(MAX_SEARCH_ATTEMPTS):
+        position = data.rfind(b'/Info', 0, end)
+        if position == -1:
+            return None
+        if match := _INFO_REFERENCE_REGEX.match(data, position):
+            return int(match.group(1)), int(match.group(2))
+        end = position
+    return None
+
+
+def _object_body(data, number, generation):
+    """Return the bytes between `obj` and `endobj` of the last definition of the object, or `None`."""
+    header = b'%d %d obj' % (number, generation)
+    end = len(data)
+    for _ in range(MAX_SEARCH_ATTEMPTS):
+        position = data.rfind(header, 0, end)
+        if position == -1:
+            return None
+        if position == 0 or not data[position - 1:position].isdigit():
+            start = position + len(header)
+            body_end = data.find(b'endobj', start)
+            return data[start:body_end] if body_end != -1 else None
+        end = position
+    return None
+
+
+def _dictionary_values(body):
+    """Yield the strings (as bytes) and the indirect references (as tuples) in the body of an object."""
+    position = 0
+    while match := _TOKEN_REGEX.search(body, position):
+        token = match.group(0)
+        if token == b'(':
+            value, position = _read_literal_string(body, match.end())
+            yield value
+        elif token == b'<':
+            end = body.find(b'>', match.end())
+            if end == -1:
+                return
+            yield _read_hex_string(body[match.end():end])
+            position = end + 1
+        else:
+            yield int(match.group(1)), int(match.group(2))
+            position = match.end()
+
+
+def _read_literal_string(body, position):
+    """Return the bytes of the literal string starting after the opening bracket at `position` and where it ends."""
+    result = bytearray()
+    depth = 1
+    while position < len(body):
+        char = body[position]
+        position += 1
+        if char == ord('\\'):
+            if position >= len(body):
+                break
+            escaped = body[position]
+            position += 1
+            if escaped in _LITERAL_STRING_ESCAPES:
+                result += _LITERAL_STRING_ESCAPES[escaped]
+            elif ord('0') <= escaped <= ord('7'):
+                digits = body[position - 1:position + 2]
+                length = 1
+                while length < len(digits) and ord('0') <= digits[length] <= ord('7'):
+                    length += 1
+                result.append(int(digits[:length], 8) & 0xff)
+                position += length - 1
+            elif escaped == ord('\r'):
+                # An escaped end of line continues the string on the next line
+                if body[position:position + 1] == b'\n':
+                    position += 1
+            elif escaped != ord('\n'):
+                result.append(escaped)
+        elif char == ord('('):
+            depth += 1
+            result.append(char)
+        elif char == ord(')'):
+            depth -= 1
+            if depth == 0:
+                break
+            result.append(char)
+        else:
+            result.append(char)
+    return bytes(result), position
+
+
+def _read_hex_string(hex_digits):
+    hex_digits = re.sub(rb'\s', b'', hex_digits)
+    if len(hex_digits) % 2:
+        hex_digits += b'0'
+    try:
+        return bytes.fromhex(hex_digits.decode('ascii'))
+    except ValueError:
+        return b''
+
+
+def _decode_pdf_string(value):
+    """Decode a pdf text string, which is either UTF-16 with a byte order mark or PDFDocEncoding."""
+    if value.startswith(codecs.BOM_UTF16_BE) or value.startswith(codecs.BOM_UTF16_LE):
+        return value.decode('utf-16', errors='replace')
+    if value.startswith(codecs.BOM_UTF8):
+        return value[len(codecs.BOM_UTF8):].decode('utf-8', errors='replace')
+    # PDFDocEncoding matches latin-1 for the characters which can appear in a DOI
+    return value.decode('latin-1')
@@ -0,0 +1,66 @@
+import codecs
+import os
+import tempfile
+from unittest import TestCase
+
+from blib.pdfmetadata import pdf_metadata_strings
+
+
+class TestPdfMetadata(TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._directory.name, 'paper.pdf')
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def write(self, contents):
+        with open(self.path, 'wb') as f:
+            f.write(contents)
+
+    def test_info_dictionary_strings_are_read_from_the_last_trailer(self):
+        self.write(
+            b'%PDF-1.4\n'
+            b'1 0 obj\n<< /Title (Old) >>\nendobj\n'
+            b'trailer\n<< /Size 2 /Info 1 0 R >>\n'
+            b'11 0 obj\n<< /Title (A \\(nested\\) title \\050x\\051) /Subject 12 0 R'
+            b' /Keywords <646f693a31302e313030302f61> >>\nendobj\n'
+            b'12 0 obj\n(Journal of Tests)\nendobj\n'
+            b'trailer\n<< /Size 13 /Info 11 0 R /Prev 9 >>\nstartxref\n0\n%%EOF\n'
+        )
+
+        self.assertEqual(
+            pdf_metadata_strings(self.path),
+            ['A (nested) title (x)', 'Journal of Tests', 'doi:10.1000/a'],
+        )
+
+    def test_utf16_strings_are_decoded(self):
+        subject = (codecs.BOM_UTF16_BE + 'Réf 10.1000/é'.encode('utf-16-be')).hex().encode('ascii')
+        self.write(
+            b'%PDF-1.7\n'
+            b'4 0 obj\n<</Subject<' + subject + b'>>>\nendobj\n'
+            b'7 0 obj\n<</Type/XRef/Info 4 0 R/Size 8>>stream\nendstream\nendobj\n'
+        )
+
+        self.assertEqual(pdf_metadata_strings(self.path), ['Réf 10.1000/é'])
+
+    def test_xmp_packets_are_returned(self):
+        self.write(
+            b'%PDF-1.4\n'
+            b'5 0 obj\n<< /Type /Metadata /Subtype /XML >>\nstream\n'
+            b'<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF><rdf:Description>'
+            b'<prism:doi>10.1000/a&amp;b</prism:doi></rdf:Description></rdf:RDF></x:xmpmeta>\n'
+            b'endstream\nendobj\n'
+        )
+
+        strings = pdf_metadata_strings(self.path)
+
+        self.assertEqual(len(strings), 1)
+        self.assertIn('<prism:doi>10.1000/a&b</prism:doi>', strings[0])
+
+    def test_files_without_metadata_give_no_strings(self):
+        self.write(b'')
+        self.assertEqual(pdf_metadata_strings(self.path), [])
+
+        self.write(b'%PDF-1.4\ntrailer\n<< /Size 1 /Info 3 0 R >>\n%%EOF\n')
+        self.assertEqual(pdf_metadata_strings(self.path), [])
@@ -0,0 +1,35 @@
+import os
+import stat
+import sys
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from blib.pdftext import pdf_text_backend, pdftotext_pages
+
+
+class TestPdfText(TestCase):
+    def test_auto_backend_uses_pdftotext_if_installed(self):
+        with patch('blib.pdftext.shutil.which', return_value='/usr/bin/pdftotext'):
+            self.assertEqual(pdf_text_backend('auto'), 'pdftotext')
+        with patch('blib.pdftext.shutil.which', return_value=None):
+            self.assertEqual(pdf_text_backend('auto'), 'pdfplumber')
+            self.assertEqual(pdf_text_backend('pdftotext'), 'pdftotext')
+        self.assertRaises(ValueError, pdf_text_backend, 'pdfminer')
+
+    def test_pdftotext_pages_are_split_on_form_feeds(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # Prints the arguments it was run with as the first page
+            executable = os.path.join(directory, 'pdftotext')
+            with open(executable, 'w') as f:
+                f.write(f'#!{sys.executable}\nimport sys\nprint(" ".join(sys.argv[1:]), end="\\fdoi:10.1000/a\\f")\n')
+            os.chmod(executable, os.stat(executable).st_mode | stat.S_IEXEC)
+
+            with patch('blib.pdftext.PDFTOTEXT_EXECUTABLE', executable):
+                pages = pdftotext_pages('/papers/paper.pdf', num_pages=2)
+
+        self.assertEqual(pages, ['-q -enc UTF-8 -f 1 -l 2 /papers/paper.pdf -', 'doi:10.1000/a', ''])
+
+    def test_missing_pdftotext_raises_file_not_found(self):
+        with patch('blib.pdftext.PDFTOTEXT_EXECUTABLE', '/missing/pdftotext'):
+            self.assertRaises(FileNotFoundError, pdftotext_pages, 'paper.pdf')
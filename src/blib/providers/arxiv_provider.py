@@ -1,71 +1,198 @@
 BLIB_HTTP_USER_AGENT = r'blib/0.1 (https://github.com/drjbarker/blib; mailto:j.barker@leeds.ac.uk)'
 
+import re
 import xml.etree.ElementTree as ET
 from datetime import datetime
-from urllib.error import URLError
-from urllib.request import Request, urlopen
-
+from urllib.error import HTTPError, URLError
+
+from blib.cache import (
+    DEFAULT_MEMORY_CACHE_SIZE,
+    MemoryCache,
+    cache_record,
+    cache_record_raw,
+    is_cache_record,
+    provider_cache,
+)
 from blib.providers.provider import Provider
+from blib.providers.transport import default_transport
 from blib.utils import normalise_spacing_accents
 
-try:
-    has_diskcache = True
-    import diskcache as dc
-except ImportError:
-    has_diskcache = False
+ARXIV_BATCH_SIZE = 50
+
+# Increment this whenever the normalisation of arXiv data changes so that cached results are re-derived from the
+# cached raw feed entries.
+ARXIV_SCHEMA_VERSION = 1
 
 
 class ArxivProvider(Provider):
 
-    def __init__(self):
+    def __init__(self, transport=None, memory_cache_size=DEFAULT_MEMORY_CACHE_SIZE):
+        self._transport = transport if transport is not None else default_transport()
         self.ns = {"atom": "http://www.w3.org/2005/Atom"}
         ET.register_namespace("", self.ns["atom"])
 
-        if has_diskcache:
-            self._cache = dc.Cache('tmp', size_limit=1e7) # 10 MB
+        self._cache = provider_cache('arxiv')
+        self.memory_cache = MemoryCache(memory_cache_size)
 
     def request(self, arxiv_id, use_cache=True):
-        if use_cache and has_diskcache and arxiv_id in self._cache:
-            return self._normalise_result(self._cache[arxiv_id])
+        if use_cache and (result := self._cached_result(arxiv_id)) is not None:
+            return result
 
         # In principle this should have the best performance if we include a user-agent
         # header with a mailto: email address. This sends us to a 'polite' set of servers
         # at crossref. In reality (possibly because we are make single very small queries)
         # lookups are MUCH faster if we use no headers.
 
-        url = f'http://export.arxiv.org/api/query?id_list={arxiv_id.removeprefix("arxiv.")}&start=0&max_results=1'
-        with urlopen(Request(url, headers={'User-Agent': BLIB_HTTP_USER_AGENT})) as response:
-            if not response.code == 200:
-                raise URLError(f"failed to resolve {url}")
+        url = self._request_url(arxiv_id)
+        body = self._transport.get(url, headers={'User-Agent': BLIB_HTTP_USER_AGENT}).body
+
+        return self._result_from_response(arxiv_id, body)
+
+    async def async_request(self, arxiv_id, use_cache=True):
+        if use_cache and (result := self._cached_result(arxiv_id)) is not None:
+            return result
+
+        response = await self._transport.async_get(
+            self._request_url(arxiv_id), headers={'User-Agent': BLIB_HTTP_USER_AGENT})
+        return self._result_from_response(arxiv_id, response.body)
+
+    def request_many(self, arxiv_ids, use_cache=True, batch_size=ARXIV_BATCH_SIZE):
+        """
+        Resolve all `arxiv_ids` using as few calls to the arXiv API as possible.
+
+        The ids which are not already cached are sent in batches of `batch_size` as a single comma separated
+        `id_list` query. The transport spaces the calls to follow the arXiv API usage policy. If a batch is rejected or
+        its feed cannot be read, its ids are requested one at a time instead. Results are returned in the same order
+        as `arxiv_ids`. Ids which cannot be resolved have an exception returned in place of the result.
+        """
+        results = {}
+        uncached_ids = []
+        for arxiv_id in arxiv_ids:
+            if arxiv_id in results or arxiv_id in uncached_ids:
+                continue
+            if use_cache and (result := self._cached_result(arxiv_id)) is not None:
+                results[arxiv_id] = result
+            else:
+                uncached_ids.append(arxiv_id)
+
+        for start in range(0, len(uncached_ids), batch_size):
+            batch = uncached_ids[start:start + batch_size]
+            url = self._request_url(*batch)
+            try:
+                response = self._transport.get(url, headers={'User-Agent': BLIB_HTTP_USER_AGENT})
+                entries = self._entries_by_id(ET.fromstring(response.body.decode('utf-8')))
+            except (HTTPError, ET.ParseError, ValueError, KeyError):
+                # A truncated feed or an id which the API rejects only fails the ids which cannot be resolved alone
+                results.update(self._request_each(batch))
+                continue
+            except URLError as error:
+                results.update({arxiv_id: error for arxiv_id in batch})
+                continue
+
+            for arxiv_id in batch:
+                entry = entries.get(arxiv_id.removeprefix("arxiv."))
+                if entry is None:
+                    results[arxiv_id] = URLError(f"failed to resolve arXiv id {arxiv_id}")
+                    continue
+                try:
+                    results[arxiv_id] = self._result_from_entry(arxiv_id, entry)
+                except Exception as error:
+                    results[arxiv_id] = error
+
+        return [results[arxiv_id] for arxiv_id in arxiv_ids]
+
+    def _cached_result(self, arxiv_id):
+        """Return the cached result for `arxiv_id` from memory or disk, or `None` if it is not cached."""
+        if (result := self.memory_cache.get(arxiv_id)) is not None:
+            return result
+
+        if self._cache is None or (entry := self._cache.get(arxiv_id)) is None:
+            return None
+
+        try:
+            if not is_cache_record(entry):
+                # Results cached before raw feed entries were stored
+                result = self._normalise_result(entry)
+            elif entry['schema'] == ARXIV_SCHEMA_VERSION:
+                result = entry['result']
+            else:
+                return self._result_from_entry(arxiv_id, ET.fromstring(cache_record_raw(entry)))
+        except Exception:
+            # A cached record which no longer normalises with a new schema is fetched again
+            return None
+
+        self.memory_cache[arxiv_id] = result
+        return result
+
+    def _request_url(self, *arxiv_ids):
+        id_list = ','.join(arxiv_id.removeprefix("arxiv.") for arxiv_id in arxiv_ids)
+        return f'http://export.arxiv.org/api/query?id_list={id_list}&start=0&max_results={len(arxiv_ids)}'
+
+    def _result_from_response(self, arxiv_id, body):
+        # Decode the response to a string and load the xml into ET
+        root = ET.fromstring(body.decode('utf-8'))
 
-            # Decode the response to a string and load the xml into ET
-            # print(response.read().decode('utf-8'))
-            root = ET.fromstring(response.read().decode('utf-8'))
+        entry = self._entry(root)
+        if entry is None:
+            raise URLError(f"failed to resolve arXiv id {arxiv_id}")
 
+        return self._result_from_entry(arxiv_id, entry)
 
+    def _result_from_entry(self, arxiv_id, entry):
         # We use some private methods to normalise the data
         result = {
             'bibtex_type': 'misc',
-            'author': self._authors(root),
-            'title': self._title(root),
-            'journal': self._journal(root),
-            'url': self._url(root),
+            'author': self._authors(entry),
+            'title': self._title(entry),
+            'journal': self._journal(entry),
+            'url': self._url(entry),
             'eprint': arxiv_id.removeprefix("arxiv."),
             'archiveprefix': 'arXiv',
-            'primaryclass': self._category(root),
-            **self._published_date(root),
+            'primaryclass': self._category(entry),
+            **self._published_date(entry),
         }
         result = self._normalise_result(result)
 
-        if has_diskcache:
-            self._cache[arxiv_id] = result
+        if self._cache is not None:
+            self._cache[arxiv_id] = cache_record(ET.tostring(entry), result, ARXIV_SCHEMA_VERSION)
+        self.memory_cache[arxiv_id] = result
 
         return result
 
+    def _entries_by_id(self, root):
+        """
+        Return the entries in an arXiv feed keyed by the id they can be requested with. The feed always contains the
+        versioned id (e.g. 2101.00001v2) so each entry is available under both its versioned and unversioned id. When
+        a batch requests several versions of one paper, the unversioned id refers to the latest of them as it does for
+        a single request.
+        """
+        entries = {}
+        latest_versions = {}
+        for entry in root.findall('atom:entry', namespaces=self.ns):
+            if entry.find('atom:id', namespaces=self.ns) is None:
+                continue
+            versioned_id = self._id(entry)
+            entries[versioned_id] = entry
+
+            match = re.search(r'v([0-9]+)$', versioned_id)
+            version = int(match.group(1)) if match else 0
+            unversioned_id = versioned_id[:match.start()] if match else versioned_id
+            if version >= latest_versions.get(unversioned_id, -1):
+                latest_versions[unversioned_id] = version
+                entries[unversioned_id] = entry
+        return entries
+
+    def _entry(self, root):
+        # The normalisation methods work on a single atom:entry, but will also accept a whole feed in which case the
+        # first entry is used.
+        if root.tag == f'{{{self.ns["atom"]}}}entry':
+            return root
+        return root.find('atom:entry', namespaces=self.ns)
+
 
     def _authors(self, root):
         author_list = []
-        for author in root.findall('atom:entry/atom:author/atom:name', namespaces=self.ns):
+        for author in self._entry(root).findall('atom:author/atom:name', namespaces=self.ns):
             names = normalise_spacing_accents(author.text).split()
             given = ' '.join(names[0:-1])
             family = names[-1]
@@ -74,28 +201,27 @@ class ArxivProvider(Provider):
         return author_list
 
     def _id(self, root):
-        arxiv_id = root.find('atom:entry/atom:id', namespaces=self.ns).text
-        return arxiv_id.removeprefix('http://arxiv.org/abs/')
+        arxiv_id = self._entry(root).find('atom:id', namespaces=self.ns).text
+        return re.sub(r'^https?://arxiv\.org/abs/', '', arxiv_id)
 
     def _url(self, root):
-        return root.find('atom:entry/atom:link', namespaces=self.ns).attrib['href']
+        return self._entry(root).find('atom:link', namespaces=self.ns).attrib['href']
 
 
     def _title(self, root):
-        return normalise_spacing_accents(root.find('atom:entry/atom:title', namespaces=self.ns).text)
+        return normalise_spacing_accents(self._entry(root).find('atom:title', namespaces=self.ns).text)
 
 
     def _category(self, root):
-        return root.find('atom:entry/atom:category', namespaces=self.ns).attrib['term']
+        return self._entry(root).find('atom:category', namespaces=self.ns).attrib['term']
 
 
     def _journal(self, root):
-        category = root.find('atom:entry/atom:category', namespaces=self.ns).attrib['term']
         return f'arXiv.{self._id(root)} [{self._category(root)}]'
 
 
     def _published_date(self, root):
-        iso_string = str(root.find('atom:entry/atom:published', namespaces=self.ns).text)
+        iso_string = str(self._entry(root).find('atom:published', namespaces=self.ns).text)
         # Python versions < 3.11 don't handle the timezone suffix so we remove it
         date = datetime.fromisoformat(iso_string.removesuffix('Z'))
         return {'year': date.year, 'month': date.month}
@@ -1,7 +1,39 @@
 import xml.etree.ElementTree as ET
 from unittest import TestCase
+from email.message import Message
+from unittest.mock import Mock, patch
+from urllib.error import URLError
 
 import blib.providers
+from blib.providers.transport import HttpResponse
+
+
+ARXIV_BATCH_FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+    <entry>
+        <id>http://arxiv.org/abs/2101.00002v3</id>
+        <published>2021-01-02T00:00:00Z</published>
+        <title>Second paper</title>
+        <author><name>Grace Hopper</name></author>
+        <link href="http://arxiv.org/abs/2101.00002v3" rel="alternate" type="text/html"/>
+        <category term="cs.PL" scheme="http://arxiv.org/schemas/atom"/>
+    </entry>
+    <entry>
+        <id>http://arxiv.org/abs/2101.00001v2</id>
+        <published>2021-01-01T00:00:00Z</published>
+        <title>First paper</title>
+        <author><name>Ada Lovelace</name></author>
+        <link href="http://arxiv.org/abs/2101.00001v2" rel="alternate" type="text/html"/>
+        <category term="cs.LG" scheme="http://arxiv.org/schemas/atom"/>
+    </entry>
+</feed>
+"""
+
+
+def mock_transport(body):
+    transport = Mock()
+    transport.get.return_value = HttpResponse(url='', status=200, headers=Message(), body=body.encode('utf-8'))
+    return transport
 
 
 class TestArxivSource(TestCase):
@@ -105,3 +137,88 @@ class TestArxivSource(TestCase):
                 "month": 3,
             },
         )
+
+    def test_request_many_maps_feed_entries_back_to_requested_ids(self):
+        transport = mock_transport(ARXIV_BATCH_FEED)
+        source = blib.providers.ArxivProvider(transport=transport)
+
+        with patch.object(source, '_cache', {}):
+            results = source.request_many(['2101.00001v2', '2101.00003', '2101.00002'])
+
+        transport.get.assert_called_once()
+        self.assertIn('id_list=2101.00001v2,2101.00003,2101.00002&', transport.get.call_args.args[0])
+        self.assertEqual(results[0]['title'], 'First paper')
+        self.assertEqual(results[0]['eprint'], '2101.00001v2')
+        self.assertIsInstance(results[1], URLError)
+        self.assertEqual(results[2]['title'], 'Second paper')
+        self.assertEqual(results[2]['journal'], 'arXiv.2101.00002v3 [cs.PL]')
+
+    def test_request_many_resolves_unversioned_id_to_latest_version_in_mixed_batch(self):
+        feed = """<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+    <entry>
+        <id>http://arxiv.org/abs/2101.00001v3</id>
+        <published>2021-01-01T00:00:00Z</published>
+        <title>First paper</title>
+        <author><name>Ada Lovelace</name></author>
+        <link href="http://arxiv.org/abs/2101.00001v3" rel="alternate" type="text/html"/>
+        <category term="cs.LG" scheme="http://arxiv.org/schemas/atom"/>
+    </entry>
+    <entry>
+        <id>http://arxiv.org/abs/2101.00001v1</id>
+        <published>2021-01-01T00:00:00Z</published>
+        <title>First draft</title>
+        <author><name>Ada Lovelace</name></author>
+        <link href="http://arxiv.org/abs/2101.00001v1" rel="alternate" type="text/html"/>
+        <category term="cs.LG" scheme="http://arxiv.org/schemas/atom"/>
+    </entry>
+</feed>
+"""
+        source = blib.providers.ArxivProvider(transport=mock_transport(feed))
+
+        with patch.object(source, '_cache', {}):
+            results = source.request_many(['2101.00001', '2101.00001v1'])
+
+        self.assertEqual([result['title'] for result in results], ['First paper', 'First draft'])
+
+    def test_request_many_requests_ids_individually_when_the_batch_feed_is_malformed(self):
+        truncated_feed = b'<feed xmlns="http://www.w3.org/2005/Atom"><entry>'
+        transport = mock_transport(ARXIV_BATCH_FEED)
+        transport.get.side_effect = [
+            HttpResponse(url='', status=200, headers=Message(), body=truncated_feed),
+            transport.get.return_value,
+            URLError('not found'),
+        ]
+        source = blib.providers.ArxivProvider(transport=transport)
+
+        with patch.object(source, '_cache', {}):
+            results = source.request_many(['2101.00002', '2101.00003'])
+
+        self.assertEqual(transport.get.call_count, 3)
+        self.assertEqual(results[0]['title'], 'Second paper')
+        self.assertIsInstance(results[1], URLError)
+
+    def test_request_many_splits_ids_into_batches(self):
+        transport = mock_transport(ARXIV_BATCH_FEED)
+        source = blib.providers.ArxivProvider(transport=transport)
+
+        with patch.object(source, '_cache', {}):
+            results = source.request_many(['2101.00001', '2101.00002'], batch_size=1)
+
+        self.assertEqual(transport.get.call_count, 2)
+        self.assertEqual([result['title'] for result in results], ['First paper', 'Second paper'])
+
+    def test_cache_rederives_result_from_raw_entry_when_schema_changes(self):
+        transport = mock_transport(ARXIV_BATCH_FEED)
+        source = blib.providers.ArxivProvider(transport=transport)
+        cache = {}
+
+        with patch.object(source, '_cache', cache):
+            source.request_many(['2101.00001', '2101.00002'])
+            cache['2101.00001']['schema'] = -1
+            cache['2101.00001']['result'] = {'title': 'stale'}
+
+            self.assertEqual(source.request('2101.00001')['title'], 'First paper')
+            self.assertEqual(source.request('2101.00002')['title'], 'Second paper')
+
+        transport.get.assert_called_once()
@@ -1,51 +1,254 @@
 import json
 import re
-from urllib.error import URLError
-from urllib.request import Request, urlopen
+import zlib
+from functools import lru_cache
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote
 
 import blib.ltwa
+from blib.cache import (
+    DEFAULT_MEMORY_CACHE_SIZE,
+    MemoryCache,
+    cache_record,
+    cache_record_raw,
+    is_cache_record,
+    is_expired,
+    is_negative_cache_record,
+    negative_cache_record,
+    provider_cache,
+)
 from blib.exception import DoiTypeError
 from blib.formatting import abbreviator
 from blib.providers.provider import Provider
-
-try:
-    has_diskcache = True
-    import diskcache as dc
-except ImportError:
-    has_diskcache = False
+from blib.providers.transport import default_transport
 
 BLIB_HTTP_USER_AGENT = r'blib/0.1 (https://github.com/drjbarker/blib; mailto:j.barker@leeds.ac.uk)'
 
+CROSSREF_BATCH_SIZE = 20
+
+# Increment this whenever the normalisation of Crossref data changes so that cached results are re-derived from the
+# cached raw responses. Changes to the LTWA abbreviations are detected automatically.
+CROSSREF_SCHEMA_VERSION = 1
+
+# How long failed lookups are remembered for. A DOI which is not found may just not have been registered yet so it is
+# retried sooner than a DOI which exists but is not a journal article (e.g. a dataset or book chapter).
+NOT_FOUND_CACHE_TTL = 24 * 60 * 60 # 1 day
+NOT_ARTICLE_CACHE_TTL = 30 * 24 * 60 * 60 # 30 days
+
+# The fields of a Crossref work read by `CrossrefProvider._result_from_message`. Full records include large
+# `reference` and `relation` lists, so by default only these fields are requested with a `select` query. Any field
+# the normalisation starts to read must be added here (see `crossref_provider_test`).
+CROSSREF_SELECT_FIELDS = (
+    'DOI', 'type', 'title', 'author', 'container-title', 'issue', 'volume', 'page', 'article-number', 'publisher',
+    'published-print', 'published-online',
+)
+
+# DOI prefixes whose page numbers are derived from the `resource` field, which cannot be selected. These DOIs are
+# always fetched as full records.
+CROSSREF_FULL_RECORD_PREFIXES = (
+    '10.1063/', # AIP Publishing
+)
+
 class CrossrefProvider(Provider):
 
-    def __init__(self):
+    def __init__(self, transport=None, use_negative_cache=True, memory_cache_size=DEFAULT_MEMORY_CACHE_SIZE,
+                 use_select=True):
+        self.use_negative_cache = use_negative_cache
+        self.use_select = use_select
+        self._transport = transport if transport is not None else default_transport()
         self._abbreviator = abbreviator.Abbreviator(blib.ltwa.LTWA_ABBREV)
         # appears to be an error in the LTWA that report -> rep. with no consideration of reports
         self._abbreviator.remove_abbreviation(r'report')
         self._abbreviator.insert_abbreviation(r'reports?', r'rep.')
-        if has_diskcache:
-            self._cache = dc.Cache('tmp', size_limit=1e7) # 10 MB
+        self._cache = provider_cache('crossref')
+        self.memory_cache = MemoryCache(memory_cache_size)
+        self._schema = (CROSSREF_SCHEMA_VERSION, _ltwa_digest(), CROSSREF_SELECT_FIELDS)
 
     def request(self, doi, use_cache=True):
-        if use_cache and has_diskcache and doi in self._cache:
-            return self._normalise_result(self._cache[doi])
+        if use_cache and (result := self._cached_result(doi)) is not None:
+            return result
 
         # In principle this should have the best performance if we include a user-agent
         # header with a mailto: email address. This sends us to a 'polite' set of servers
         # at crossref. In reality (possibly because we are make single very small queries)
         # lookups are MUCH faster if we use no headers.
 
-        url = f'https://api.crossref.org/works/{doi}'
-        with urlopen(Request(url, headers={'User-Agent': BLIB_HTTP_USER_AGENT})) as response:
-            if not response.code == 200:
-                raise URLError(f"failed to resolve https://api.crossref.org/works/{doi}")
+        url = self._request_url(doi)
+        try:
+            body = self._transport.get(url, headers={'User-Agent': BLIB_HTTP_USER_AGENT}).body
+        except HTTPError as error:
+            self._remember_failure(doi, error)
+            raise
+
+        return self._result_from_response(doi, body)
+
+    async def async_request(self, doi, use_cache=True):
+        if use_cache and (result := self._cached_result(doi)) is not None:
+            return result
+
+        try:
+            response = await self._transport.async_get(
+                self._request_url(doi), headers={'User-Agent': BLIB_HTTP_USER_AGENT})
+        except HTTPError as error:
+            self._remember_failure(doi, error)
+            raise
+        return self._result_from_response(doi, response.body)
+
+    def request_many(self, dois, use_cache=True, batch_size=CROSSREF_BATCH_SIZE):
+        """
+        Resolve all `dois` using as few calls to the Crossref API as possible.
+
+        The DOIs which are not already cached are fetched `batch_size` at a time with a `/works?filter=doi:...` query.
+        If Crossref rejects a batch or its response cannot be read, the DOIs in it are requested one at a time instead.
+        Results are returned in the same order as `dois`. DOIs which cannot be resolved have an exception returned in
+        place of the result.
+        """
+        results = {}
+        uncached_dois = []
+        for doi in dois:
+            if doi in results or doi in uncached_dois:
+                continue
+            try:
+                result = self._cached_result(doi) if use_cache else None
+            except (DoiTypeError, HTTPError) as error:
+                result = error
+            if result is None:
+                uncached_dois.append(doi)
+            else:
+                results[doi] = result
+
+        # Values in a Crossref filter are separated by commas, so DOIs which contain a comma have to be requested
+        # individually.
+        results.update(self._request_each([doi for doi in uncached_dois if not self._is_batchable(doi)]))
+
+        # DOIs whose full record is needed are batched separately without `select`
+        batchable_dois = [doi for doi in uncached_dois if self._is_batchable(doi)]
+        for select in (True, False):
+            group = [doi for doi in batchable_dois if self._uses_select(doi) == select]
+            for start in range(0, len(group), batch_size):
+                results.update(self._request_batch(group[start:start + batch_size], select))
+
+        return [results[doi] for doi in dois]
+
+    def _request_batch(self, batch, select):
+        """Fetch the DOIs in `batch` with one filter query and return a dict of the results or errors."""
+        url = self._request_many_url(batch, select)
+        try:
+            response = self._transport.get(url, headers={'User-Agent': BLIB_HTTP_USER_AGENT})
+            items = json.loads(response.body.decode('utf-8'))['message']['items']
+            # DOIs are case insensitive and Crossref does not necessarily return them in the case they were requested
+            items_by_doi = {item['DOI'].lower(): item for item in items}
+        except (HTTPError, ValueError, KeyError):
+            # One malformed or unusual DOI can make Crossref reject the whole filter, so only fail the DOIs which
+            # cannot be resolved on their own
+            return self._request_each(batch)
+        except URLError as error:
+            return {doi: error for doi in batch}
+
+        results = {}
+        for doi in batch:
+            jdata = items_by_doi.get(doi.lower())
+            if jdata is None:
+                results[doi] = HTTPError(url, 404, f"no crossref entry for {doi}", None, None)
+                self._remember_failure(doi, results[doi])
+                continue
+            try:
+                results[doi] = self._result_from_message(doi, jdata, CROSSREF_SELECT_FIELDS if select else None)
+            except Exception as error:
+                results[doi] = error
+        return results
+
+    def _cached_result(self, doi):
+        """
+        Return the cached result for `doi` from memory or disk, or `None` if it is not cached. Raises the original error
+        if the lookup is negatively cached.
+        """
+        if (result := self.memory_cache.get(doi)) is not None:
+            return result
+
+        if self._cache is None or (entry := self._cache.get(doi)) is None:
+            return None
+
+        if is_negative_cache_record(entry):
+            if not self.use_negative_cache or is_expired(entry):
+                return None
+            if entry['error'] == 'not-article':
+                raise DoiTypeError(entry['message'])
+            raise HTTPError(self._request_url(doi), 404, entry['message'], None, None)
+
+        try:
+            if not is_cache_record(entry):
+                # Results cached before raw responses were stored
+                result = self._normalise_result(entry)
+            elif entry['schema'] == self._schema:
+                result = entry['result']
+            elif entry.get('fields') is None or set(CROSSREF_SELECT_FIELDS) <= set(entry['fields']):
+                jdata = json.loads(cache_record_raw(entry).decode('utf-8'))
+                return self._result_from_message(doi, jdata, entry.get('fields'))
+            else:
+                # The cached response does not include every field the normalisation now reads
+                return None
+        except Exception:
+            # A cached record which no longer normalises (e.g. with a new schema or LTWA) is fetched again
+            return None
 
-            # Decode the response to a string. This *should* be a json dataset which we then
-            # convert to a dictionary and return.
-            jdata = json.loads(response.read().decode('utf-8'))['message']
+        self.memory_cache[doi] = result
+        return result
 
+    def _remember_failure(self, doi, error):
+        """
+        Cache that `doi` does not exist or is not a journal article. These lookups always fail so there is no point
+        in making the same network request on every run.
+        """
+        if self._cache is None:
+            return
+        if isinstance(error, DoiTypeError):
+            self._cache[doi] = negative_cache_record('not-article', str(error), NOT_ARTICLE_CACHE_TTL)
+        elif isinstance(error, HTTPError) and error.code == 404:
+            self._cache[doi] = negative_cache_record('not-found', str(error.reason), NOT_FOUND_CACHE_TTL)
+
+    def _is_batchable(self, doi):
+        return ',' not in doi
+
+    def _uses_select(self, doi):
+        return self.use_select and not doi.lower().startswith(CROSSREF_FULL_RECORD_PREFIXES)
+
+    def _selected_fields(self):
+        return CROSSREF_SELECT_FIELDS if self.use_select else None
+
+    def _request_url(self, doi):
+        # `select` is only supported by the filter query so single DOIs are looked up as a batch of one
+        if self._is_batchable(doi) and self._uses_select(doi):
+            return self._request_many_url([doi], select=True)
+        return f'https://api.crossref.org/works/{doi}'
+
+    def _request_many_url(self, dois, select):
+        doi_filter = ','.join(f'doi:{quote(doi, safe="/")}' for doi in dois)
+        url = f'https://api.crossref.org/works?filter={doi_filter}&rows={len(dois)}'
+        if select:
+            url += f'&select={",".join(CROSSREF_SELECT_FIELDS)}'
+        return url
+
+    def _result_from_response(self, doi, body):
+        # Decode the response to a string. This *should* be a json dataset which we then
+        # convert to a dictionary and return.
+        message = json.loads(body.decode('utf-8'))['message']
+        if 'items' not in message:
+            return self._result_from_message(doi, message)
+
+        # Response to a filter query
+        items_by_doi = {item['DOI'].lower(): item for item in message['items']}
+        if (jdata := items_by_doi.get(doi.lower())) is None:
+            error = HTTPError(self._request_url(doi), 404, f"no crossref entry for {doi}", None, None)
+            self._remember_failure(doi, error)
+            raise error
+        return self._result_from_message(doi, jdata, self._selected_fields())
+
+    def _result_from_message(self, doi, jdata, fields=None):
         if jdata['type'] != 'journal-article':
-            raise DoiTypeError(f'DOI {doi} is not a journal article type')
+            error = DoiTypeError(f'DOI {doi} is not a journal article type')
+            self._remember_failure(doi, error)
+            raise error
 
         # We use some private methods to normalise the data
         result = {
@@ -63,8 +266,9 @@ class CrossrefProvider(Provider):
             **self._published_date(jdata)}
         result = self._normalise_result(result)
 
-        if has_diskcache:
-            self._cache[doi] = result
+        if self._cache is not None:
+            self._cache[doi] = cache_record(json.dumps(jdata).encode('utf-8'), result, self._schema, fields)
+        self.memory_cache[doi] = result
 
         return result
 
@@ -213,3 +417,8 @@ class CrossrefProvider(Provider):
                 normalised["month"] = str(published_date["month"])
 
         return normalised
+
+
+@lru_cache(maxsize=None)
+def _ltwa_digest():
+    return zlib.crc32(repr(sorted(blib.ltwa.LTWA_ABBREV.items())).encode('utf-8'))
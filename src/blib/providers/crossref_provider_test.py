@@ -1,6 +1,62 @@
-from unittest import TestCase
+import json
+from email.message import Message
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+from urllib.error import HTTPError
 
 import blib.providers
+from blib.cache import cache_record, negative_cache_record
+from blib.exception import DoiTypeError
+from blib.providers.crossref_provider import (
+    BLIB_HTTP_USER_AGENT,
+    CROSSREF_SELECT_FIELDS,
+    NOT_ARTICLE_CACHE_TTL,
+    NOT_FOUND_CACHE_TTL,
+)
+from blib.providers.transport import HttpResponse
+
+
+def crossref_message(doi, **fields):
+    """Return a Crossref work for `doi`. Default fields can be overridden and removed by passing `None`."""
+    message = {
+        'DOI': doi,
+        'type': 'journal-article',
+        'title': ['Notes on the Analytical Engine'],
+        'author': [{'given': 'Ada', 'family': 'Lovelace'}],
+        'container-title': ['Journal of Engines'],
+        'volume': '7',
+        'issue': '2',
+        'page': '10-19',
+        'publisher': 'Example Press',
+        'published-print': {'date-parts': [[2024, 5]]},
+        **fields,
+    }
+    return {key: value for key, value in message.items() if value is not None}
+
+
+class KeyRecordingDict(dict):
+    """Dictionary which records the keys that are read from it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.keys_read = set()
+
+    def __getitem__(self, key):
+        self.keys_read.add(key)
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        self.keys_read.add(key)
+        return super().__contains__(key)
+
+    def get(self, key, default=None):
+        self.keys_read.add(key)
+        return super().get(key, default)
+
+
+def crossref_response(doi, **fields):
+    body = json.dumps({'status': 'ok', 'message': crossref_message(doi, **fields)}).encode('utf-8')
+    return HttpResponse(url=f'https://api.crossref.org/works/{doi}', status=200, headers=Message(), body=body)
 
 
 class TestCrossrefSource(TestCase):
@@ -44,3 +100,294 @@ class TestCrossrefSource(TestCase):
                 "month": "5",
             },
         )
+
+    def test_request_many_fetches_batches_with_doi_filter(self):
+        body = json.dumps({'status': 'ok', 'message': {'items': [
+            crossref_message('10.1000/b'),
+            crossref_message('10.1000/abc', type='dataset'),
+            crossref_message('10.1000/a'),
+        ]}}).encode('utf-8')
+        transport = Mock()
+        transport.get.return_value = HttpResponse(url='', status=200, headers=Message(), body=body)
+        source = blib.providers.CrossrefProvider(transport=transport)
+
+        with patch.object(source, '_cache', {}):
+            results = source.request_many(['10.1000/A', '10.1000/missing', '10.1000/abc', '10.1000/b'])
+
+        transport.get.assert_called_once()
+        self.assertEqual(
+            transport.get.call_args.args[0],
+            'https://api.crossref.org/works?filter=doi:10.1000/A,doi:10.1000/missing,doi:10.1000/abc,doi:10.1000/b'
+            f'&rows=4&select={",".join(CROSSREF_SELECT_FIELDS)}',
+        )
+        self.assertEqual(results[0]['doi'], '10.1000/a')
+        self.assertEqual(results[0]['journal_abbreviation'], 'J. Engines')
+        self.assertIsInstance(results[1], HTTPError)
+        self.assertIsInstance(results[2], DoiTypeError)
+        self.assertEqual(results[3]['doi'], '10.1000/b')
+
+    def test_request_many_requests_dois_individually_when_a_batch_fails(self):
+        rejected = HTTPError('https://api.crossref.org/works', 400, 'Bad Request', None, None)
+        not_json = HttpResponse(url='', status=200, headers=Message(), body=b'<html>Service Unavailable</html>')
+
+        for name, failure in (('rejected', rejected), ('not json', not_json)):
+            with self.subTest(name):
+                transport = Mock()
+                transport.get.side_effect = [failure, crossref_response('10.1000/a'), rejected]
+                source = blib.providers.CrossrefProvider(transport=transport)
+
+                with patch.object(source, '_cache', {}):
+                    results = source.request_many(['10.1000/a', '10.1000/<bad>'])
+
+                self.assertEqual(transport.get.call_count, 3)
+                self.assertEqual(results[0]['doi'], '10.1000/a')
+                self.assertIsInstance(results[1], HTTPError)
+
+    def test_request_many_requests_dois_containing_commas_individually(self):
+        transport = Mock()
+        source = blib.providers.CrossrefProvider(transport=transport)
+
+        with patch.object(source, '_cache', {}), \
+             patch.object(source, 'request', return_value={'doi': '10.1000/a,b'}) as request:
+            results = source.request_many(['10.1000/a,b'])
+
+        request.assert_called_once_with('10.1000/a,b', use_cache=False)
+        transport.get.assert_not_called()
+        self.assertEqual(results, [{'doi': '10.1000/a,b'}])
+
+    def test_cache_stores_raw_response_and_rederives_when_schema_changes(self):
+        transport = Mock()
+        transport.get.return_value = crossref_response('10.1000/cached')
+        source = blib.providers.CrossrefProvider(transport=transport)
+        cache = {}
+
+        with patch.object(source, '_cache', cache):
+            source.request('10.1000/cached')
+            self.assertEqual(cache['10.1000/cached']['result']['journal_abbreviation'], 'J. Engines')
+
+            with patch.object(source, '_journal_abbrev', return_value='J. Eng.'):
+                self.assertEqual(source.request('10.1000/cached')['journal_abbreviation'], 'J. Engines')
+
+                # A new process starts with an empty memory cache
+                source._schema = ('changed',)
+                source.memory_cache.clear()
+                self.assertEqual(source.request('10.1000/cached')['journal_abbreviation'], 'J. Eng.')
+
+        transport.get.assert_called_once()
+        self.assertEqual(cache['10.1000/cached']['schema'], ('changed',))
+        self.assertEqual(cache['10.1000/cached']['result']['journal_abbreviation'], 'J. Eng.')
+
+    def test_cached_records_which_no_longer_normalise_are_fetched_again(self):
+        stale = crossref_message('10.1000/stale', type=None)
+        body = json.dumps({'status': 'ok', 'message': {'items': [crossref_message('10.1000/stale')]}}).encode('utf-8')
+        transport = Mock()
+        transport.get.return_value = HttpResponse(url='', status=200, headers=Message(), body=body)
+        source = blib.providers.CrossrefProvider(transport=transport)
+        cache = {
+            '10.1000/stale': cache_record(
+                json.dumps(stale).encode('utf-8'), {'doi': '10.1000/stale'}, ('old',), CROSSREF_SELECT_FIELDS),
+        }
+
+        with patch.object(source, '_cache', cache):
+            results = source.request_many(['10.1000/stale'])
+
+        transport.get.assert_called_once()
+        self.assertEqual(results[0]['title'], 'Notes on the Analytical Engine')
+        self.assertEqual(cache['10.1000/stale']['schema'], source._schema)
+
+    def test_failed_lookups_are_negatively_cached_until_they_expire(self):
+        transport = Mock()
+        transport.get.side_effect = [
+            crossref_response('10.1000/dataset', type='dataset'),
+            HTTPError('https://api.crossref.org/works/10.1000/missing', 404, 'Not Found', None, None),
+        ]
+        source = blib.providers.CrossrefProvider(transport=transport)
+        cache = {}
+
+        with patch.object(source, '_cache', cache):
+            for _ in range(2):
+                self.assertRaises(DoiTypeError, source.request, '10.1000/dataset')
+                self.assertRaises(HTTPError, source.request, '10.1000/missing')
+            self.assertEqual(transport.get.call_count, 2)
+            self.assertGreater(
+                cache['10.1000/dataset']['expires'] - cache['10.1000/missing']['expires'],
+                NOT_ARTICLE_CACHE_TTL - NOT_FOUND_CACHE_TTL - 60)
+
+            cache['10.1000/missing']['expires'] = 0
+            transport.get.side_effect = [crossref_response('10.1000/missing')]
+            self.assertEqual(source.request('10.1000/missing')['doi'], '10.1000/missing')
+
+    def test_negative_cache_can_be_bypassed(self):
+        transport = Mock()
+        transport.get.return_value = crossref_response('10.1000/new')
+        source = blib.providers.CrossrefProvider(transport=transport, use_negative_cache=False)
+        cache = {'10.1000/new': negative_cache_record('not-found', 'Not Found', NOT_FOUND_CACHE_TTL)}
+
+        with patch.object(source, '_cache', cache):
+            self.assertEqual(source.request('10.1000/new')['doi'], '10.1000/new')
+
+        transport.get.assert_called_once()
+        self.assertEqual(cache['10.1000/new']['result']['doi'], '10.1000/new')
+
+    def test_request_many_returns_negatively_cached_errors_in_place(self):
+        transport = Mock()
+        source = blib.providers.CrossrefProvider(transport=transport)
+        cache = {'10.1000/dataset': negative_cache_record('not-article', 'not an article', NOT_ARTICLE_CACHE_TTL)}
+
+        with patch.object(source, '_cache', cache):
+            results = source.request_many(['10.1000/dataset'])
+
+        transport.get.assert_not_called()
+        self.assertIsInstance(results[0], DoiTypeError)
+
+    def test_memory_cache_answers_repeated_lookups_without_reading_disk(self):
+        transport = Mock()
+        transport.get.return_value = crossref_response('10.1000/a')
+        source = blib.providers.CrossrefProvider(transport=transport)
+        cache = MagicMock()
+        cache.get.return_value = None
+
+        with patch.object(source, '_cache', cache):
+            first = source.request('10.1000/a')
+            self.assertIs(source.request('10.1000/a'), first)
+            self.assertEqual(source.request_many(['10.1000/a', '10.1000/a']), [first, first])
+
+        transport.get.assert_called_once()
+        cache.get.assert_called_once_with('10.1000/a')
+        self.assertEqual((source.memory_cache.hits, source.memory_cache.misses), (2, 1))
+
+    def test_select_fields_cover_everything_the_normaliser_reads(self):
+        source = blib.providers.CrossrefProvider(transport=Mock())
+        messages = [
+            crossref_message('10.1000/page'),
+            crossref_message('10.1000/article-number', **{'article-number': 'e1'}, page=None),
+            crossref_message('10.1126/sciadv.abc123', **{'container-title': ['Science Advances']}, page=None),
+            crossref_message('10.1002/adma.202302419', page=None),
+            crossref_message('10.1000/online', **{'published-online': {'date-parts': [[2023]]}}),
+        ]
+
+        keys_read = set()
+        with patch.object(source, '_cache', None):
+            for message in messages:
+                jdata = KeyRecordingDict(message)
+                source._result_from_message(jdata['DOI'], jdata)
+                keys_read |= jdata.keys_read
+
+        self.assertLessEqual(keys_read, set(CROSSREF_SELECT_FIELDS))
+
+    def test_request_selects_fields_with_a_filter_query(self):
+        body = json.dumps({'status': 'ok', 'message': {'items': [crossref_message('10.1000/A')]}}).encode('utf-8')
+        transport = Mock()
+        transport.get.return_value = HttpResponse(url='', status=200, headers=Message(), body=body)
+        source = blib.providers.CrossrefProvider(transport=transport)
+        cache = {}
+
+        with patch.object(source, '_cache', cache):
+            result = source.request('10.1000/a')
+
+        self.assertEqual(result['doi'], '10.1000/A')
+        self.assertEqual(
+            transport.get.call_args.args[0],
+            f'https://api.crossref.org/works?filter=doi:10.1000/a&rows=1&select={",".join(CROSSREF_SELECT_FIELDS)}',
+        )
+        self.assertEqual(cache['10.1000/a']['fields'], CROSSREF_SELECT_FIELDS)
+
+    def test_request_fetches_full_records_for_aip_dois(self):
+        transport = Mock()
+        transport.get.return_value = crossref_response('10.1063/5.0001', page=None, resource={
+            'primary': {'URL': 'https://pubs.aip.org/aip/apl/article/7/2/021101/123'}})
+        source = blib.providers.CrossrefProvider(transport=transport)
+
+        with patch.object(source, '_cache', {}):
+            result = source.request('10.1063/5.0001')
+
+        transport.get.assert_called_once_with(
+            'https://api.crossref.org/works/10.1063/5.0001', headers={'User-Agent': BLIB_HTTP_USER_AGENT})
+        self.assertEqual(result['pages'], ['021101'])
+
+    def test_request_many_batches_aip_dois_as_full_records(self):
+        resource = {'primary': {'URL': 'https://pubs.aip.org/aip/apl/article/7/2/021101/123'}}
+        full_records = json.dumps({'status': 'ok', 'message': {'items': [
+            crossref_message(doi, page=None, resource=resource) for doi in ('10.1063/5.0001', '10.1063/5.0002')
+        ]}}).encode('utf-8')
+        selected = json.dumps({'status': 'ok', 'message': {'items': [crossref_message('10.1000/a')]}}).encode('utf-8')
+        transport = Mock()
+        transport.get.side_effect = [
+            HttpResponse(url='', status=200, headers=Message(), body=selected),
+            HttpResponse(url='', status=200, headers=Message(), body=full_records),
+        ]
+        source = blib.providers.CrossrefProvider(transport=transport)
+
+        with patch.object(source, '_cache', {}):
+            results = source.request_many(['10.1063/5.0001', '10.1000/a', '10.1063/5.0002'])
+
+        self.assertEqual(
+            [call.args[0] for call in transport.get.call_args_list],
+            [
+                f'https://api.crossref.org/works?filter=doi:10.1000/a&rows=1&select={",".join(CROSSREF_SELECT_FIELDS)}',
+                'https://api.crossref.org/works?filter=doi:10.1063/5.0001,doi:10.1063/5.0002&rows=2',
+            ],
+        )
+        self.assertEqual([result['pages'] for result in results], [['021101'], ['10', '19'], ['021101']])
+
+    def test_cached_selection_missing_new_fields_is_refetched(self):
+        transport = Mock()
+        transport.get.return_value = crossref_response('10.1000/a')
+        source = blib.providers.CrossrefProvider(transport=transport, use_select=False)
+        cache = {'10.1000/a': cache_record(
+            json.dumps(crossref_message('10.1000/a')).encode('utf-8'), {'doi': 'old'}, ('old',), ('DOI', 'type'))}
+
+        with patch.object(source, '_cache', cache):
+            self.assertEqual(source.request('10.1000/a')['doi'], '10.1000/a')
+
+        transport.get.assert_called_once()
+        self.assertIsNone(cache['10.1000/a']['fields'])
+
+
+class TestCrossrefAsyncRequest(IsolatedAsyncioTestCase):
+    async def test_async_request_normalises_response(self):
+        transport = Mock()
+        transport.async_get = AsyncMock(return_value=crossref_response('10.1000/async'))
+        source = blib.providers.CrossrefProvider(transport=transport)
+
+        result = await source.async_request('10.1000/async', use_cache=False)
+
+        self.assertEqual(result['author'], [{'given': 'Ada', 'family': 'Lovelace'}])
+        self.assertEqual(result['journal_abbreviation'], 'J. Engines')
+        self.assertEqual(result['pages'], ['10', '19'])
+        self.assertEqual((result['year'], result['month']), ('2024', '5'))
+
+    async def test_async_request_many_returns_results_in_order_with_failures_in_place(self):
+        async def get(url, headers=None):
+            doi = url.removeprefix('https://api.crossref.org/works/')
+            if doi == '10.1000/async-missing':
+                raise HTTPError(url, 404, 'not found', Message(), None)
+            if doi == '10.1000/async-book':
+                return crossref_response(doi, type='book')
+            return crossref_response(doi)
+
+        transport = Mock()
+        transport.async_get = AsyncMock(side_effect=get)
+        source = blib.providers.CrossrefProvider(transport=transport, use_select=False)
+
+        with patch.object(source, '_cache', {}):
+            results = await source.async_request_many(
+                ['10.1000/async-a', '10.1000/async-missing', '10.1000/async-book', '10.1000/async-b'],
+                concurrency=2,
+            )
+
+        self.assertEqual(results[0]['doi'], '10.1000/async-a')
+        self.assertIsInstance(results[1], HTTPError)
+        self.assertIsInstance(results[2], DoiTypeError)
+        self.assertEqual(results[3]['doi'], '10.1000/async-b')
+
+    async def test_async_request_many_requests_repeated_dois_once(self):
+        transport = Mock()
+        transport.async_get = AsyncMock(return_value=crossref_response('10.1000/async'))
+        source = blib.providers.CrossrefProvider(transport=transport)
+
+        with patch.object(source, '_cache', {}):
+            results = await source.async_request_many(['10.1000/async'] * 3)
+
+        transport.async_get.assert_awaited_once()
+        self.assertEqual([result['doi'] for result in results], ['10.1000/async'] * 3)
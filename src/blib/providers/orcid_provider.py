@@ -1,14 +1,19 @@
 import json
-from dataclasses import dataclass
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
 from typing import Optional
-from urllib.error import URLError
-from urllib.request import Request, urlopen
 
+from blib.cache import provider_cache
 from blib.resourceid import ResourceId, ResourceIdType
 from blib.providers.provider import Provider
+from blib.providers.transport import OfflineError, default_transport
 
 BLIB_HTTP_USER_AGENT = r'blib/0.1 (https://github.com/drjbarker/blib; mailto:j.barker@leeds.ac.uk)'
 
+# Number of works lists fetched at once by `OrcidProvider.request_merged`
+DEFAULT_ORCID_JOBS = 8
+
 
 @dataclass
 class OrcidWork:
@@ -17,31 +22,186 @@ class OrcidWork:
     month: Optional[int]
     day: Optional[int]
     position: int
+    put_code: Optional[int] = None
+    last_modified: Optional[int] = None
 
 
 class OrcidProvider(Provider):
+    """
+    Lists the DOIs of the works on ORCID records.
+
+    The works can be restricted to those published between `since` and `until`, given as (year, month, day) tuples
+    where month and day may be `None`, and to the `limit` most recent works. Works without a publication date are
+    dropped by these filters because they cannot be placed in time. Filtering happens before any DOI is looked up.
+
+    With `sync` set a snapshot of the put-code and last-modified-date of every work is kept for each ORCID iD. When
+    the works are listed again they are compared with the snapshot from the previous sync: `new_dois()` returns the
+    DOIs of works which have been added since and `changed_dois()` those of works which have been modified. Only the
+    modified works need to be fetched again rather than refreshing every DOI, new works can still be resolved from the
+    cache. The snapshot is not updated when the works are listed. Once the DOIs have been looked up
+    `commit_snapshot()` advances it for the works which were resolved, so a work whose refetch failed, or which was
+    not looked up at all, is reported as changed again on the next sync.
+    """
+
+    def __init__(self, transport=None, sync=False, since=None, until=None, limit=None):
+        self.sync = sync
+        self.since = since
+        self.until = until
+        self.limit = limit
+        self._transport = transport if transport is not None else default_transport()
+        # A list of works changes whenever a publication is added so it is always refetched. The last response is kept
+        # so that the works can still be listed when running offline.
+        self._cache = provider_cache('orcid')
+        self._lock = threading.Lock()
+        # The (previous, current) snapshot of each ORCID iD listed with `sync` set
+        self._snapshots = {}
+
     def request(self, orcid):
-        url = f'https://pub.orcid.org/v3.0/{orcid}/works'
-        with urlopen(Request(url, headers={
+        works, _ = self._works_from_response(orcid, self._works_response(orcid))
+        return self._resource_ids(self._filter_works(self._merge_works(works)))
+
+    def request_merged(self, orcids, jobs=DEFAULT_ORCID_JOBS, errors=None):
+        """
+        Return the DOIs of the works of all `orcids` as one list, e.g. for the publication list of a group.
+
+        The works lists are fetched concurrently. A work shared by several researchers is only listed once and the
+        list is sorted chronologically as for a single ORCID iD. Works without a date keep the order of `orcids`. If
+        `errors` is given, the `OfflineError` for each ORCID iD whose works are not in the cache while offline is
+        stored in it and the other works are still listed, rather than the error being raised.
+        """
+        orcids = list(dict.fromkeys(orcids))
+        if not orcids:
+            return []
+
+        def fetch_works(orcid):
+            try:
+                return self._works_from_response(orcid, self._works_response(orcid))
+            except OfflineError as error:
+                if errors is None:
+                    raise
+                errors[orcid] = error
+                return [], 0
+
+        with ThreadPoolExecutor(max_workers=min(jobs, len(orcids))) as executor:
+            works_lists = list(executor.map(fetch_works, orcids))
+
+        works = []
+        position_offset = 0
+        for orcid_works, group_count in works_lists:
+            # Offset the positions so that the order of works without dates follows the order of `orcids`
+            works += [replace(work, position=work.position + position_offset) for work in orcid_works]
+            position_offset += group_count
+        return self._resource_ids(self._filter_works(self._merge_works(works)))
+
+    def _works_response(self, orcid):
+        url = self._request_url(orcid)
+        try:
+            body = self._transport.get(url, headers=self._request_headers()).body
+        except OfflineError:
+            return self._offline_response(orcid)
+        self._store_response(orcid, body)
+        return body
+
+    async def async_request(self, orcid):
+        try:
+            response = await self._transport.async_get(self._request_url(orcid), headers=self._request_headers())
+            body = response.body
+        except OfflineError:
+            body = self._offline_response(orcid)
+        else:
+            self._store_response(orcid, body)
+        works, _ = self._works_from_response(orcid, body)
+        return self._resource_ids(self._filter_works(self._merge_works(works)))
+
+    def _offline_response(self, orcid):
+        if self._cache is None or orcid not in self._cache:
+            raise OfflineError(f'works for ORCID {orcid} are not in the cache')
+        return self._cache[orcid]
+
+    def _store_response(self, orcid, body):
+        if self._cache is not None:
+            self._cache[orcid] = body
+
+    def _request_url(self, orcid):
+        return f'https://pub.orcid.org/v3.0/{orcid}/works'
+
+    def _request_headers(self):
+        return {
             'User-Agent': BLIB_HTTP_USER_AGENT,
             'Accept': 'application/json',
-        })) as response:
-            if response.code != 200:
-                raise URLError(f"failed to resolve {url}")
-
-            data = json.loads(response.read().decode('utf-8'))
-
-        works = self._parse_works(data)
+        }
+
+    def _works_from_response(self, orcid, body):
+        """Return the works in a works list response for `orcid` and the number of work groups in it."""
+        data = json.loads(body.decode('utf-8'))
+        works = self._works_from_data(data)
+        if self.sync and self._cache is not None:
+            previous = self._cache.get(f'snapshot:{orcid}') or {}
+            with self._lock:
+                self._snapshots[orcid] = (previous, self._snapshot(works))
+        return works, len(data.get('group', []))
+
+    def _resource_ids(self, works):
         return [ResourceId(work.doi, ResourceIdType.doi) for work in works]
 
+    def new_dois(self):
+        """Return the DOIs of the works listed with `sync` which were added since the last snapshot."""
+        return {doi for previous, current in self._snapshots.values()
+                for work_key, (_, doi) in current.items() if work_key not in previous}
+
+    def changed_dois(self):
+        """Return the DOIs of the works listed with `sync` which were modified since the last snapshot."""
+        return {doi for previous, current in self._snapshots.values()
+                for work_key, (_, doi) in current.items()
+                if work_key in previous and previous[work_key] != current[work_key]}
+
+    def unchanged_count(self):
+        """Return the number of works listed with `sync` which are unchanged since the last snapshot."""
+        return sum(previous.get(work_key) == entry
+                   for previous, current in self._snapshots.values() for work_key, entry in current.items())
+
+    def commit_snapshot(self, resolved_dois):
+        """
+        Save the snapshot of each ORCID iD listed with `sync`, advancing only the works whose DOI is in
+        `resolved_dois`. Other works keep their previous entry (or stay out of the snapshot if they are new), so they
+        are compared against the same state again on the next sync. Works no longer on the record are dropped.
+        """
+        if self._cache is None:
+            return
+
+        resolved_dois = set(resolved_dois)
+        for orcid, (previous, current) in self._snapshots.items():
+            snapshot = {}
+            for work_key, entry in current.items():
+                if entry[1] in resolved_dois:
+                    snapshot[work_key] = entry
+                elif work_key in previous:
+                    snapshot[work_key] = previous[work_key]
+            self._cache[f'snapshot:{orcid}'] = snapshot
+
+    def _snapshot(self, works):
+        snapshot = {}
+        for work in works:
+            # Works should always have a put-code, but fall back to the DOI rather than lose track of the work
+            work_key = work.put_code if work.put_code is not None else work.doi
+            snapshot[work_key] = (work.last_modified, work.doi)
+        return snapshot
+
     def _parse_works(self, data):
-        unique_works = {}
+        return self._merge_works(self._works_from_data(data))
 
+    def _works_from_data(self, data):
+        works = []
         for position, group in enumerate(data.get('group', [])):
             work = self._work_from_group(group, position)
-            if work is None:
-                continue
+            if work is not None:
+                works.append(work)
+        return works
+
+    def _merge_works(self, works):
+        unique_works = {}
 
+        for work in works:
             if work.doi not in unique_works:
                 unique_works[work.doi] = work
                 continue
@@ -66,6 +226,8 @@ class OrcidProvider(Provider):
                     month=month,
                     day=day,
                     position=position,
+                    put_code=summary.get('put-code'),
+                    last_modified=self._last_modified(group),
                 )
 
         doi = self._first_doi(group.get('external-ids', {}))
@@ -73,14 +235,38 @@ class OrcidProvider(Provider):
             return None
 
         year, month, day = self._group_publication_date(group)
+        summaries = group.get('work-summary') or [{}]
         return OrcidWork(
             doi=doi.lower(),
             year=year,
             month=month,
             day=day,
             position=position,
+            put_code=summaries[0].get('put-code'),
+            last_modified=self._last_modified(group),
         )
 
+    def _filter_works(self, works):
+        """Return the `works` (sorted by `_sort_key`) within the `since`/`until` dates and `limit`."""
+        if self.since is None and self.until is None and self.limit is None:
+            return works
+
+        works = [work for work in works if work.year is not None]
+        if self.since is not None:
+            # A work is included if it could have been published on or after `since`, e.g. a work from 2020 without a
+            # month is included for since=(2020, 6, None)
+            since_year, since_month, since_day = self.since
+            works = [work for work in works if (work.year, work.month or 12, work.day or 31)
+                     >= (since_year, since_month or 1, since_day or 1)]
+        if self.until is not None:
+            until_year, until_month, until_day = self.until
+            works = [work for work in works if (work.year, work.month or 1, work.day or 1)
+                     <= (until_year, until_month or 12, until_day or 31)]
+        if self.limit is not None:
+            # Works are sorted from oldest to newest
+            works = works[-self.limit:] if self.limit > 0 else []
+        return works
+
     def _sort_key(self, work):
         has_date = work.year is not None
         return (
@@ -92,6 +278,11 @@ class OrcidProvider(Provider):
             work.doi,
         )
 
+    def _last_modified(self, group):
+        """Return the last-modified-date of a work group in milliseconds since the epoch."""
+        last_modified = group.get('last-modified-date') or {}
+        return last_modified.get('value')
+
     def _group_publication_date(self, group):
         dates = []
         for summary in group.get('work-summary', []):
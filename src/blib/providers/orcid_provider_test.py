@@ -1,6 +1,10 @@
+import json
+from email.message import Message
 from unittest import TestCase
+from unittest.mock import Mock, patch
 
 from blib.providers.orcid_provider import OrcidProvider
+from blib.providers.transport import HttpResponse, OfflineError
 
 
 class TestOrcidProvider(TestCase):
@@ -196,3 +200,153 @@ class TestOrcidProvider(TestCase):
         self.assertEqual([work.doi for work in works], ['10.1000/first-source', '10.1000/crossref'])
         self.assertEqual((works[0].year, works[0].month, works[0].day), (2024, 10, 5))
         self.assertEqual((works[1].year, works[1].month, works[1].day), (2025, 1, 15))
+
+    def test_works_are_listed_from_the_last_response_when_offline(self):
+        body = json.dumps({'group': [{
+            'external-ids': {'external-id': [{'external-id-type': 'doi', 'external-id-value': '10.1000/a'}]},
+            'work-summary': [{}],
+        }]}).encode('utf-8')
+        transport = Mock()
+        transport.get.return_value = HttpResponse(url='', status=200, headers=Message(), body=body)
+        provider = OrcidProvider(transport=transport)
+
+        with patch.object(provider, '_cache', {}):
+            online = provider.request('0000-0003-4843-5516')
+            transport.get.side_effect = OfflineError('offline')
+
+            self.assertEqual(provider.request('0000-0003-4843-5516'), online)
+            self.assertRaises(OfflineError, provider.request, '0000-0000-0000-0000')
+
+        self.assertEqual([resource_id.id for resource_id in online], ['10.1000/a'])
+
+    def test_request_merged_dedupes_works_across_orcids(self):
+        def work(doi, year=None):
+            summary = {'publication-date': {'year': {'value': str(year)}}} if year else {}
+            return {
+                'external-ids': {'external-id': [{'external-id-type': 'doi', 'external-id-value': doi}]},
+                'work-summary': [summary],
+            }
+
+        responses = {
+            'https://pub.orcid.org/v3.0/0000-0000-0000-0001/works': {'group': [
+                work('10.1000/undated-a'), work('10.1000/shared', 2021), work('10.1000/c', 2023)]},
+            'https://pub.orcid.org/v3.0/0000-0000-0000-0002/works': {'group': [
+                work('10.1000/undated-b'), work('10.1000/SHARED', 2021), work('10.1000/d', 2020)]},
+        }
+        transport = Mock()
+        transport.get.side_effect = lambda url, headers=None: HttpResponse(
+            url=url, status=200, headers=Message(), body=json.dumps(responses[url]).encode('utf-8'))
+        provider = OrcidProvider(transport=transport)
+
+        with patch.object(provider, '_cache', {}):
+            resource_ids = provider.request_merged(['0000-0000-0000-0001', '0000-0000-0000-0002'], jobs=2)
+
+        self.assertEqual(
+            [resource_id.id for resource_id in resource_ids],
+            ['10.1000/d', '10.1000/shared', '10.1000/c', '10.1000/undated-a', '10.1000/undated-b'],
+        )
+        self.assertEqual(transport.get.call_count, 2)
+
+    def test_request_merged_records_orcids_missing_from_cache_when_offline(self):
+        body = json.dumps({'group': [{
+            'external-ids': {'external-id': [{'external-id-type': 'doi', 'external-id-value': '10.1000/a'}]},
+            'work-summary': [{}],
+        }]}).encode('utf-8')
+        transport = Mock()
+        transport.get.side_effect = OfflineError('offline')
+        provider = OrcidProvider(transport=transport)
+        errors = {}
+
+        with patch.object(provider, '_cache', {'0000-0000-0000-0001': body}):
+            resource_ids = provider.request_merged(['0000-0000-0000-0001', '0000-0000-0000-0002'], errors=errors)
+            self.assertRaises(OfflineError, provider.request_merged, ['0000-0000-0000-0002'])
+
+        self.assertEqual([resource_id.id for resource_id in resource_ids], ['10.1000/a'])
+        self.assertEqual(list(errors), ['0000-0000-0000-0002'])
+        self.assertIsInstance(errors['0000-0000-0000-0002'], OfflineError)
+
+    def test_sync_reports_new_and_changed_works_since_the_last_snapshot(self):
+        def work(put_code, doi, last_modified):
+            return {
+                'last-modified-date': {'value': last_modified},
+                'external-ids': {'external-id': [{'external-id-type': 'doi', 'external-id-value': doi}]},
+                'work-summary': [{'put-code': put_code}],
+            }
+
+        def response(*groups):
+            body = json.dumps({'group': list(groups)}).encode('utf-8')
+            return HttpResponse(url='', status=200, headers=Message(), body=body)
+
+        transport = Mock()
+        cache = {}
+        transport.get.return_value = response(work(1, '10.1000/a', 100), work(2, '10.1000/b', 100))
+        with patch('blib.providers.orcid_provider.provider_cache', return_value=cache):
+            first = OrcidProvider(transport=transport, sync=True)
+            first.request('0000-0003-4843-5516')
+            first.commit_snapshot(['10.1000/a', '10.1000/b'])
+
+            transport.get.return_value = response(
+                work(1, '10.1000/a', 100), work(2, '10.1000/b', 200), work(3, '10.1000/c', 200))
+            second = OrcidProvider(transport=transport, sync=True)
+            resource_ids = second.request('0000-0003-4843-5516')
+
+        self.assertEqual(first.new_dois(), {'10.1000/a', '10.1000/b'})
+        self.assertEqual(len(resource_ids), 3)
+        self.assertEqual(second.new_dois(), {'10.1000/c'})
+        self.assertEqual(second.changed_dois(), {'10.1000/b'})
+        self.assertEqual(second.unchanged_count(), 1)
+
+    def test_snapshot_only_advances_for_works_which_were_resolved(self):
+        def response(last_modified):
+            body = json.dumps({'group': [{
+                'last-modified-date': {'value': last_modified},
+                'external-ids': {'external-id': [{'external-id-type': 'doi', 'external-id-value': doi}]},
+                'work-summary': [{'put-code': put_code}],
+            } for put_code, doi in ((1, '10.1000/a'), (2, '10.1000/b'))]}).encode('utf-8')
+            return HttpResponse(url='', status=200, headers=Message(), body=body)
+
+        def sync(last_modified, resolved_dois=None):
+            transport = Mock()
+            transport.get.return_value = response(last_modified)
+            provider = OrcidProvider(transport=transport, sync=True)
+            provider.request('0000-0003-4843-5516')
+            if resolved_dois is not None:
+                provider.commit_snapshot(resolved_dois)
+            return provider
+
+        with patch('blib.providers.orcid_provider.provider_cache', return_value={}):
+            sync(100, ['10.1000/a', '10.1000/b'])
+            # The refetch of 10.1000/b fails, and a run which is not committed (e.g. offline) changes nothing
+            self.assertEqual(sync(200, ['10.1000/a']).changed_dois(), {'10.1000/a', '10.1000/b'})
+            self.assertEqual(sync(200).changed_dois(), {'10.1000/b'})
+            self.assertEqual(sync(200, ['10.1000/b']).changed_dois(), {'10.1000/b'})
+            self.assertEqual(sync(200).changed_dois(), set())
+
+    def test_works_are_filtered_by_date_and_limit(self):
+        def work(doi, *date):
+            return {
+                'external-ids': {'external-id': [{'external-id-type': 'doi', 'external-id-value': doi}]},
+                'work-summary': [{'publication-date': dict(zip(
+                    ('year', 'month', 'day'), ({'value': str(value)} for value in date)))}],
+            }
+
+        body = json.dumps({'group': [
+            work('10.1000/2018', 2018, 5, 1), work('10.1000/2020', 2020), work('10.1000/2021', 2021, 3, 9),
+            work('10.1000/2023', 2023, 7), work('10.1000/2025', 2025, 1, 1), work('10.1000/undated'),
+        ]}).encode('utf-8')
+        transport = Mock()
+        transport.get.return_value = HttpResponse(url='', status=200, headers=Message(), body=body)
+
+        def request(**filters):
+            provider = OrcidProvider(transport=transport, **filters)
+            with patch.object(provider, '_cache', {}):
+                return [resource_id.id for resource_id in provider.request('0000-0003-4843-5516')]
+
+        self.assertEqual(len(request()), 6)
+        self.assertEqual(
+            request(since=(2020, 6, None)), ['10.1000/2020', '10.1000/2021', '10.1000/2023', '10.1000/2025'])
+        self.assertEqual(
+            request(until=(2023, None, None)), ['10.1000/2018', '10.1000/2020', '10.1000/2021', '10.1000/2023'])
+        self.assertEqual(request(since=(2021, 3, 10), until=(2023, 7, 1)), ['10.1000/2023'])
+        self.assertEqual(request(limit=2), ['10.1000/2023', '10.1000/2025'])
+        self.assertEqual(request(until=(2022, None, None), limit=1), ['10.1000/2021'])
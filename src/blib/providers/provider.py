@@ -1,5 +1,50 @@
+import asyncio
+
+DEFAULT_ASYNC_CONCURRENCY = 8
+
+
 class Provider:
     def request(self,url):
         raise NotImplementedError(
             "Provider subclasses must implement the `request()` method."
-        )
\ No newline at end of file
+        )
+
+    def _request_each(self, resource_ids):
+        """
+        Request each of `resource_ids` on its own, bypassing the cache, and return a dict of the results. Ids which
+        cannot be resolved have the exception in place of the result. This is the fallback for a batch which failed
+        as a whole, e.g. because one unusual id made the server reject it, so that only the bad ids fail.
+        """
+        results = {}
+        for resource_id in resource_ids:
+            try:
+                results[resource_id] = self.request(resource_id, use_cache=False)
+            except Exception as error:
+                results[resource_id] = error
+        return results
+
+    async def async_request(self, resource_id):
+        raise NotImplementedError(
+            "Provider subclasses must implement the `async_request()` method."
+        )
+
+    async def async_request_many(self, resource_ids, concurrency=DEFAULT_ASYNC_CONCURRENCY):
+        """
+        Resolve all `resource_ids` on the running event loop with at most `concurrency` requests in flight.
+
+        Results are returned in the same order as `resource_ids`. A failed lookup does not cancel the others, instead
+        the exception is returned in place of the result. Ids which are repeated are only requested once.
+        """
+        unique_ids = list(dict.fromkeys(resource_ids))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded_request(resource_id):
+            async with semaphore:
+                return await self.async_request(resource_id)
+
+        results = await asyncio.gather(
+            *(bounded_request(resource_id) for resource_id in unique_ids),
+            return_exceptions=True
+        )
+        results_by_id = dict(zip(unique_ids, results))
+        return [results_by_id[resource_id] for resource_id in resource_ids]
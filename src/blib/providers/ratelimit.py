@@ -0,0 +1,117 @@
+import asyncio
+import re
+import threading
+import time
+
+# Requests allowed per interval (in seconds) for hosts with a known usage policy. The arXiv API terms of use ask
+# clients to make no more than one request every three seconds. Crossref advertises its current limit in the
+# X-Rate-Limit-* headers of every response, the value here is only used until the first response arrives. The ORCID
+# public API allows 24 requests per second.
+DEFAULT_RATE_LIMITS = {
+    'export.arxiv.org': (1, 3),
+    'api.crossref.org': (5, 1),
+    'pub.orcid.org': (24, 1),
+}
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `limit` requests every `interval` seconds.
+
+    Tokens are reserved rather than waited for, so a caller is told how long it must wait before making its request
+    and the bucket can go into debt. This lets many threads (or coroutines) share one bucket without holding a lock
+    while they sleep, each successive caller is simply scheduled one slot later than the last.
+    """
+
+    def __init__(self, limit, interval, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = float(limit)
+        self._updated = clock()
+        self.limit = limit
+        self.interval = interval
+
+    def set_limit(self, limit, interval):
+        with self._lock:
+            # Any extra allowance from a raised limit is available straight away
+            self._tokens = min(float(limit), self._tokens + max(0, limit - self.limit))
+            self.limit = limit
+            self.interval = interval
+
+    def reserve(self):
+        """Take a token and return the number of seconds to wait before it may be used."""
+        with self._lock:
+            now = self._clock()
+            rate = self.limit / self.interval
+            self._tokens = min(float(self.limit), self._tokens + (now - self._updated) * rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / rate
+
+
+class RateLimiter:
+    """
+    Per-host request scheduler shared by every thread using a `HttpTransport`.
+
+    Hosts listed in `limits` are throttled with a `TokenBucket`, other hosts are not limited. Limits advertised by a
+    server with the `X-Rate-Limit-Limit` and `X-Rate-Limit-Interval` headers (as Crossref does) replace the configured
+    limit for that host as soon as they are seen.
+    """
+
+    def __init__(self, limits=None, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets = {}
+        for host, (limit, interval) in (DEFAULT_RATE_LIMITS if limits is None else limits).items():
+            self._buckets[host] = TokenBucket(limit, interval, clock=clock)
+
+    def reserve(self, host):
+        with self._lock:
+            bucket = self._buckets.get(host)
+        if bucket is None:
+            return 0.0
+        return bucket.reserve()
+
+    def wait(self, host):
+        if delay := self.reserve(host):
+            time.sleep(delay)
+
+    async def async_wait(self, host):
+        if delay := self.reserve(host):
+            await asyncio.sleep(delay)
+
+    def update_from_headers(self, host, headers):
+        limit = headers.get('X-Rate-Limit-Limit')
+        interval = parse_interval(headers.get('X-Rate-Limit-Interval'))
+        if not limit or not interval:
+            return
+
+        try:
+            limit = int(limit)
+        except ValueError:
+            return
+        if limit < 1:
+            return
+
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                self._buckets[host] = TokenBucket(limit, interval, clock=self._clock)
+                return
+        if (bucket.limit, bucket.interval) != (limit, interval):
+            bucket.set_limit(limit, interval)
+
+
+def parse_interval(value):
+    """Return the number of seconds in an interval such as "1s", "500ms" or "2m". Returns `None` if not valid."""
+    if not value:
+        return None
+
+    match = re.fullmatch(r'\s*([0-9]+(?:\.[0-9]+)?)\s*(ms|s|m|h)?\s*', value)
+    if not match:
+        return None
+
+    seconds = float(match.group(1)) * {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}[match.group(2) or 's']
+    return seconds if seconds > 0 else None
@@ -0,0 +1,68 @@
+from unittest import TestCase
+
+from blib.providers.ratelimit import RateLimiter, TokenBucket, parse_interval
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(TestCase):
+    def test_reservations_are_spaced_by_the_interval(self):
+        clock = FakeClock()
+        bucket = TokenBucket(1, 3, clock=clock)
+
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertAlmostEqual(bucket.reserve(), 3.0)
+        self.assertAlmostEqual(bucket.reserve(), 6.0)
+
+        clock.now = 6.0
+        self.assertAlmostEqual(bucket.reserve(), 3.0)
+
+    def test_allows_bursts_up_to_the_limit(self):
+        clock = FakeClock()
+        bucket = TokenBucket(5, 1, clock=clock)
+
+        self.assertEqual([bucket.reserve() for _ in range(5)], [0.0] * 5)
+        self.assertAlmostEqual(bucket.reserve(), 0.2)
+
+
+class TestRateLimiter(TestCase):
+    def test_unknown_hosts_are_not_limited(self):
+        limiter = RateLimiter(limits={}, clock=FakeClock())
+
+        self.assertEqual([limiter.reserve('example.org') for _ in range(3)], [0.0] * 3)
+
+    def test_arxiv_is_limited_to_one_request_every_three_seconds(self):
+        limiter = RateLimiter(clock=FakeClock())
+
+        self.assertEqual(limiter.reserve('export.arxiv.org'), 0.0)
+        self.assertAlmostEqual(limiter.reserve('export.arxiv.org'), 3.0)
+
+    def test_limit_is_updated_from_crossref_headers(self):
+        limiter = RateLimiter(limits={'api.crossref.org': (1, 1)}, clock=FakeClock())
+
+        limiter.update_from_headers('api.crossref.org', {'X-Rate-Limit-Limit': '50', 'X-Rate-Limit-Interval': '1s'})
+
+        self.assertEqual([limiter.reserve('api.crossref.org') for _ in range(50)], [0.0] * 50)
+        self.assertAlmostEqual(limiter.reserve('api.crossref.org'), 0.02)
+
+    def test_invalid_headers_are_ignored(self):
+        limiter = RateLimiter(limits={}, clock=FakeClock())
+
+        limiter.update_from_headers('api.crossref.org', {'X-Rate-Limit-Limit': 'lots', 'X-Rate-Limit-Interval': '1s'})
+        limiter.update_from_headers('api.crossref.org', {'X-Rate-Limit-Limit': '50'})
+
+        self.assertEqual([limiter.reserve('api.crossref.org') for _ in range(100)], [0.0] * 100)
+
+    def test_parse_interval(self):
+        self.assertEqual(parse_interval('1s'), 1)
+        self.assertEqual(parse_interval('500ms'), 0.5)
+        self.assertEqual(parse_interval('2m'), 120)
+        self.assertEqual(parse_interval('3'), 3)
+        self.assertIsNone(parse_interval('soon'))
+        self.assertIsNone(parse_interval('0s'))
@@ -0,0 +1,111 @@
+import http.client
+import random
+import socket
+import threading
+import time
+from urllib.error import HTTPError, URLError
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class RetryPolicy:
+    """
+    Decides whether a failed request is worth repeating and how long to wait first.
+
+    Server errors, rate limiting (429) and connection problems such as timeouts are usually transient so these are
+    retried up to `max_attempts` times in total. The wait grows exponentially from `base_delay` up to `max_delay` with
+    "full jitter" (a uniformly random fraction of the backoff) so that many threads which failed together do not all
+    retry at the same moment. A `Retry-After` header sent by the server takes precedence over the backoff.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=30, random=random.random):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._random = random
+
+    def retry_delay(self, error, attempt):
+        """Return the seconds to wait before retrying after `error` on the zero based `attempt`, or `None`."""
+        if attempt + 1 >= self.max_attempts or not is_transient_error(error):
+            return None
+
+        if (retry_after := _retry_after(error)) is not None:
+            return min(retry_after, self.max_delay)
+
+        return self._random() * min(self.max_delay, self.base_delay * 2 ** attempt)
+
+
+class CircuitOpenError(URLError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker which fails requests straight away once a host appears to be down.
+
+    After `failure_threshold` consecutive failures the circuit for a host opens and requests to it raise
+    `CircuitOpenError` without touching the network. Once `reset_timeout` seconds have passed a single trial request
+    is let through, if it succeeds the circuit closes again and if it fails the circuit stays open for another
+    `reset_timeout`. This means a large batch finishes in bounded time during an outage instead of every lookup
+    waiting for its own socket timeouts and retries.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = {}
+        self._opened_at = {}
+
+    def check(self, host):
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return
+            if self._clock() - opened_at < self.reset_timeout:
+                raise CircuitOpenError(f'{host} is unavailable after repeated failures')
+            # Let this request through as a trial and keep everyone else out until it has finished
+            self._opened_at[host] = self._clock()
+
+    def record_success(self, host):
+        with self._lock:
+            self._failures.pop(host, None)
+            self._opened_at.pop(host, None)
+
+    def record_failure(self, host):
+        with self._lock:
+            self._failures[host] = self._failures.get(host, 0) + 1
+            if self._failures[host] >= self.failure_threshold:
+                self._opened_at[host] = self._clock()
+
+
+def is_transient_error(error):
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, HTTPError):
+        return error.code in RETRY_STATUS_CODES
+    if isinstance(error, URLError):
+        # A host name which does not resolve will not start resolving a second later, unless the failure is explicitly
+        # a temporary one.
+        if isinstance(error.reason, socket.gaierror):
+            return error.reason.errno == socket.EAI_AGAIN
+        return isinstance(error.reason, (OSError, http.client.HTTPException))
+    return False
+
+
+def is_host_failure(error):
+    """Return whether `error` suggests the host is unhealthy, as opposed to the request being rate limited."""
+    if isinstance(error, HTTPError) and error.code == 429:
+        return False
+    return is_transient_error(error)
+
+
+def _retry_after(error):
+    if not isinstance(error, HTTPError) or error.headers is None:
+        return None
+    try:
+        return max(0.0, float(error.headers.get('Retry-After')))
+    except (TypeError, ValueError):
+        # Retry-After can also be a HTTP date. This is rare for APIs so we fall back to the normal backoff.
+        return None
@@ -0,0 +1,77 @@
+import socket
+from email.message import Message
+from unittest import TestCase
+from urllib.error import HTTPError, URLError
+
+from blib.providers.retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+
+def http_error(code, **headers):
+    message = Message()
+    for key, value in headers.items():
+        message[key.replace('_', '-')] = value
+    return HTTPError('https://api.crossref.org/works/10.1000/a', code, 'error', message, None)
+
+
+class TestRetryPolicy(TestCase):
+    def test_backoff_grows_exponentially_with_jitter(self):
+        policy = RetryPolicy(max_attempts=5, base_delay=1, max_delay=5, random=lambda: 0.5)
+        error = http_error(503)
+
+        self.assertEqual([policy.retry_delay(error, attempt) for attempt in range(4)], [0.5, 1, 2, 2.5])
+        self.assertIsNone(policy.retry_delay(error, 4))
+
+    def test_retry_after_header_takes_precedence(self):
+        policy = RetryPolicy(random=lambda: 0.5)
+
+        self.assertEqual(policy.retry_delay(http_error(429, Retry_After='7'), 0), 7)
+
+    def test_only_transient_errors_are_retried(self):
+        policy = RetryPolicy(random=lambda: 0.5)
+
+        self.assertIsNotNone(policy.retry_delay(URLError(TimeoutError('timed out')), 0))
+        self.assertIsNotNone(policy.retry_delay(URLError(ConnectionResetError()), 0))
+        self.assertIsNotNone(policy.retry_delay(URLError(socket.gaierror(socket.EAI_AGAIN, 'try again')), 0))
+        self.assertIsNone(policy.retry_delay(URLError(socket.gaierror(socket.EAI_NONAME, 'unknown host')), 0))
+        self.assertIsNone(policy.retry_delay(http_error(404), 0))
+        self.assertIsNone(policy.retry_delay(URLError('too many redirects'), 0))
+        self.assertIsNone(policy.retry_delay(CircuitOpenError('down'), 0))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker(TestCase):
+    def test_opens_after_consecutive_failures_and_allows_a_trial_after_timeout(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+
+        breaker.record_failure('api.crossref.org')
+        breaker.check('api.crossref.org')
+        breaker.record_failure('api.crossref.org')
+
+        with self.assertRaises(CircuitOpenError):
+            breaker.check('api.crossref.org')
+        breaker.check('export.arxiv.org')
+
+        clock.now = 10
+        breaker.check('api.crossref.org')
+        with self.assertRaises(CircuitOpenError):
+            breaker.check('api.crossref.org')
+
+        breaker.record_success('api.crossref.org')
+        breaker.check('api.crossref.org')
+
+    def test_success_resets_failure_count(self):
+        breaker = CircuitBreaker(failure_threshold=2, clock=FakeClock())
+
+        breaker.record_failure('api.crossref.org')
+        breaker.record_success('api.crossref.org')
+        breaker.record_failure('api.crossref.org')
+
+        breaker.check('api.crossref.org')
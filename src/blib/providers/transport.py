@@ -0,0 +1,456 @@
+import asyncio
+import base64
+import http.client
+import ssl
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from email.message import Message
+from http.client import parse_headers
+from io import BytesIO
+from urllib.error import HTTPError, URLError
+from urllib.parse import unquote, urljoin, urlsplit
+from urllib.request import getproxies, proxy_bypass
+
+from blib.providers.ratelimit import RateLimiter
+from blib.providers.retry import CircuitBreaker, RetryPolicy, is_host_failure
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_POOL_SIZE = 4
+MAX_REDIRECTS = 5
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+ACCEPT_ENCODING = 'gzip, deflate'
+READ_CHUNK_SIZE = 64 * 1024
+
+# Loading the CA certificates is slow so one context is shared by every asyncio request
+_async_ssl_context = None
+
+
+@dataclass
+class HttpResponse:
+    url: str
+    status: int
+    headers: Message
+    body: bytes
+    # Size of the body as it was sent, before any Content-Encoding was decoded
+    wire_size: int = 0
+
+
+class ContentDecoder:
+    """
+    Streaming decoder for a `Content-Encoding` of gzip, deflate or identity.
+
+    Chunks of the body are decompressed as they are read so a large response is never held in memory both compressed
+    and decompressed. `wire_size` counts the bytes passed to `decode`.
+    """
+
+    def __init__(self, encoding):
+        self.encoding = (encoding or 'identity').strip().lower()
+        if self.encoding not in ('gzip', 'x-gzip', 'deflate', 'identity'):
+            raise URLError(f'unsupported content encoding "{encoding}"')
+        self.wire_size = 0
+        self._decompressor = None
+        if self.encoding in ('gzip', 'x-gzip'):
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decode(self, data):
+        self.wire_size += len(data)
+        if self.encoding == 'identity':
+            return data
+        if self._decompressor is None and data:
+            # "deflate" should be zlib wrapped (RFC 9110) but some servers send a raw deflate stream
+            is_zlib = (data[0] & 0x0f) == 8 and len(data) > 1 and (data[0] * 256 + data[1]) % 31 == 0
+            self._decompressor = zlib.decompressobj(zlib.MAX_WBITS if is_zlib else -zlib.MAX_WBITS)
+        return self._decompressor.decompress(data) if self._decompressor else b''
+
+    def flush(self):
+        if self._decompressor is None:
+            return b''
+        return self._decompressor.flush()
+
+
+class TransferStats:
+    """Thread safe count of the responses received by a transport and their size on the wire and once decoded."""
+
+    def __init__(self):
+        self.responses = 0
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+        self._lock = threading.Lock()
+
+    def record(self, response):
+        with self._lock:
+            self.responses += 1
+            self.wire_bytes += response.wire_size
+            self.decoded_bytes += len(response.body)
+
+
+class OfflineError(URLError):
+    """Raised instead of making a request when the transport is offline."""
+    pass
+
+
+class HttpTransport:
+    """
+    HTTP client shared by the providers which keeps connections to each host open between requests.
+
+    Opening a new connection for every lookup means paying for a TCP and TLS handshake each time, which for small API
+    responses can take longer than the request itself. Up to `pool_size` idle connections are kept per host and reused
+    by later requests, so repeated lookups against api.crossref.org go over warm connections. The transport is thread
+    safe, each connection is only used by one thread at a time.
+
+    Every request is scheduled through `rate_limiter` so that all threads sharing the transport stay within the usage
+    policy of each host (see `blib.providers.ratelimit`). Transient failures are retried according to `retry_policy`
+    and hosts which keep failing are skipped by `circuit_breaker` (see `blib.providers.retry`).
+
+    Errors are raised in the same way as `urlopen`: `HTTPError` for 4xx/5xx responses, `URLError` for connection
+    problems and timeouts and `ValueError` for urls which are not http(s). When `offline` is set every request raises
+    `OfflineError` without touching the network, so providers can only answer from their caches.
+
+    Responses are requested with gzip or deflate compression, which is decoded transparently. Crossref records with
+    long reference lists and arXiv Atom feeds compress several times over. `stats` counts the bytes received.
+
+    Proxies are configured in the same way as for `urlopen`, e.g. with the `HTTP_PROXY`, `HTTPS_PROXY` and `NO_PROXY`
+    environment variables. https requests are tunnelled through the proxy with CONNECT.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, rate_limiter=None, retry_policy=None,
+                 circuit_breaker=None, offline=False):
+        self.offline = offline
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        self.stats = TransferStats()
+        self._idle_connections = {}
+        self._lock = threading.Lock()
+        self._ssl_context = ssl.create_default_context()
+
+    def get(self, url, headers=None):
+        if self.offline:
+            raise OfflineError(f'not fetching {url} while offline')
+        host = urlsplit(url).hostname
+        attempt = 0
+        while True:
+            self.circuit_breaker.check(host)
+            try:
+                response = self._get_with_redirects(url, headers or {})
+            except URLError as error:
+                delay = self._handle_failure(host, error, attempt)
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            self.circuit_breaker.record_success(host)
+            self.stats.record(response)
+            return response
+
+    async def async_get(self, url, headers=None):
+        if self.offline:
+            raise OfflineError(f'not fetching {url} while offline')
+        host = urlsplit(url).hostname
+        attempt = 0
+        while True:
+            self.circuit_breaker.check(host)
+            try:
+                if self._proxy(url) is not None:
+                    # The asyncio client cannot use a proxy, so fetch over the pooled connections in a worker thread
+                    response = await asyncio.get_running_loop().run_in_executor(
+                        None, self._get_with_redirects, url, headers or {})
+                else:
+                    await self.rate_limiter.async_wait(host)
+                    response = await async_get(url, headers, timeout=self.timeout)
+            except URLError as error:
+                if isinstance(error, HTTPError) and error.headers is not None:
+                    self.rate_limiter.update_from_headers(host, error.headers)
+                delay = self._handle_failure(host, error, attempt)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            self.rate_limiter.update_from_headers(host, response.headers)
+            self.circuit_breaker.record_success(host)
+            self.stats.record(response)
+            return response
+
+    def _handle_failure(self, host, error, attempt):
+        """Record a failed request and return how long to wait before retrying. Re-raises `error` if not retrying."""
+        if is_host_failure(error):
+            self.circuit_breaker.record_failure(host)
+        delay = self.retry_policy.retry_delay(error, attempt)
+        if delay is None:
+            raise error
+        return delay
+
+    def _get_with_redirects(self, url, headers):
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._get_once(url, headers)
+
+            if response.status in REDIRECT_CODES and 'Location' in response.headers:
+                url = urljoin(url, response.headers['Location'])
+                continue
+
+            if response.status >= 400:
+                raise HTTPError(url, response.status, f'failed to resolve {url}', response.headers, None)
+
+            return response
+
+        raise URLError(f'too many redirects fetching {url}')
+
+    def close(self):
+        with self._lock:
+            connections = [c for pool in self._idle_connections.values() for c in pool]
+            self._idle_connections.clear()
+        for connection in connections:
+            connection.close()
+
+    def _get_once(self, url, headers):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f'unsupported url scheme: {url}')
+
+        proxy = self._proxy(url)
+        key = (parts.scheme, parts.hostname, parts.port, proxy)
+        path = parts.path or '/'
+        if parts.query:
+            path = f'{path}?{parts.query}'
+        headers = {'Accept-Encoding': ACCEPT_ENCODING, **headers}
+        if proxy is not None and parts.scheme == 'http':
+            # Plain http requests are sent to the proxy with the absolute url
+            path = f'http://{parts.netloc}{path}'
+            headers.update(_proxy_headers(proxy))
+
+        self.rate_limiter.wait(parts.hostname)
+
+        connection, reused = self._acquire(key)
+        try:
+            try:
+                response = self._send(connection, path, headers)
+            except (http.client.HTTPException, OSError) as err:
+                # The server may have closed an idle connection since it was last used. GET requests are safe to
+                # repeat so try once more on a fresh connection.
+                if not reused or isinstance(err, TimeoutError):
+                    raise
+                connection.close()
+                connection = self._connect(key)
+                response = self._send(connection, path, headers)
+            decoder = ContentDecoder(response.headers.get('Content-Encoding'))
+            chunks = []
+            while chunk := response.read(READ_CHUNK_SIZE):
+                chunks.append(decoder.decode(chunk))
+            chunks.append(decoder.flush())
+            body = b''.join(chunks)
+        except (http.client.HTTPException, OSError, zlib.error) as err:
+            connection.close()
+            raise URLError(err)
+        except URLError:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(key, connection)
+
+        self.rate_limiter.update_from_headers(parts.hostname, response.headers)
+
+        return HttpResponse(
+            url=url, status=response.status, headers=response.headers, body=body, wire_size=decoder.wire_size)
+
+    def _send(self, connection, path, headers):
+        connection.request('GET', path, headers=headers)
+        return connection.getresponse()
+
+    def _acquire(self, key):
+        with self._lock:
+            pool = self._idle_connections.get(key)
+            if pool:
+                return pool.pop(), True
+        return self._connect(key), False
+
+    def _release(self, key, connection):
+        with self._lock:
+            pool = self._idle_connections.setdefault(key, [])
+            if len(pool) < self.pool_size:
+                pool.append(connection)
+                return
+        connection.close()
+
+    def _connect(self, key):
+        scheme, host, port, proxy = key
+        if proxy is None:
+            if scheme == 'https':
+                return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self._ssl_context)
+            return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+        proxy_parts = urlsplit(proxy)
+        if scheme == 'https':
+            connection = http.client.HTTPSConnection(
+                proxy_parts.hostname, proxy_parts.port, timeout=self.timeout, context=self._ssl_context)
+            connection.set_tunnel(host, port, headers=_proxy_headers(proxy))
+            return connection
+        return http.client.HTTPConnection(proxy_parts.hostname, proxy_parts.port, timeout=self.timeout)
+
+    def _proxy(self, url):
+        """Return the url of the proxy to fetch `url` through, or `None` to connect directly."""
+        parts = urlsplit(url)
+        proxy = getproxies().get(parts.scheme)
+        if not proxy or proxy_bypass(parts.hostname or ''):
+            return None
+        # Proxies are often given without a scheme, e.g. HTTP_PROXY=proxy.example.org:3128
+        return proxy if '://' in proxy else f'http://{proxy}'
+
+
+def _proxy_headers(proxy):
+    """Return the headers which authenticate with `proxy` if its url includes a username and password."""
+    parts = urlsplit(proxy)
+    if parts.username is None:
+        return {}
+    credentials = f'{unquote(parts.username)}:{unquote(parts.password or "")}'
+    return {'Proxy-Authorization': 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')}
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+def default_transport():
+    """Return the transport shared by all providers, creating it on first use."""
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = HttpTransport()
+        return _default_transport
+
+
+def configure_transport(**kwargs):
+    """Replace the shared transport with one created with `kwargs`. Providers created afterwards will use it."""
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is not None:
+            _default_transport.close()
+        _default_transport = HttpTransport(**kwargs)
+        return _default_transport
+
+
+async def async_get(url, headers=None, timeout=DEFAULT_TIMEOUT):
+    """
+    Fetch `url` with a HTTP GET request on the running event loop and return a `HttpResponse`.
+
+    This is a deliberately small HTTP/1.1 client built on asyncio streams so that blib can be used from an event loop
+    without pushing blocking `urlopen` calls into executor threads. Redirects are followed. Errors are raised in the
+    same way as `urlopen`: `HTTPError` for 4xx/5xx responses, `URLError` for connection problems and timeouts and
+    `ValueError` for urls which are not http(s).
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        try:
+            response = await asyncio.wait_for(_async_get_once(url, headers or {}), timeout)
+        except asyncio.TimeoutError:
+            raise URLError(TimeoutError(f'timed out fetching {url}'))
+        except (OSError, asyncio.IncompleteReadError, zlib.error) as err:
+            raise URLError(err)
+
+        if response.status in REDIRECT_CODES and 'Location' in response.headers:
+            url = urljoin(url, response.headers['Location'])
+            continue
+
+        if response.status >= 400:
+            raise HTTPError(url, response.status, f'failed to resolve {url}', response.headers, None)
+
+        return response
+
+    raise URLError(f'too many redirects fetching {url}')
+
+
+async def _async_get_once(url, headers):
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        raise ValueError(f'unsupported url scheme: {url}')
+
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    ssl_context = _default_ssl_context() if parts.scheme == 'https' else None
+    reader, writer = await asyncio.open_connection(parts.hostname, port, ssl=ssl_context)
+
+    try:
+        path = parts.path or '/'
+        if parts.query:
+            path = f'{path}?{parts.query}'
+
+        request_headers = {'Host': parts.netloc, 'Connection': 'close', 'Accept-Encoding': ACCEPT_ENCODING, **headers}
+        request = f'GET {path} HTTP/1.1\r\n'
+        request += ''.join(f'{key}: {value}\r\n' for key, value in request_headers.items())
+        request += '\r\n'
+        writer.write(request.encode('latin-1'))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        try:
+            _, status, *_ = status_line.decode('latin-1').split(None, 2)
+            status = int(status)
+        except ValueError:
+            raise URLError(f'malformed response from {url}')
+
+        header_lines = []
+        while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+            header_lines.append(line)
+        response_headers = parse_headers(BytesIO(b''.join(header_lines) + b'\r\n'))
+
+        decoder = ContentDecoder(response_headers.get('Content-Encoding'))
+        if response_headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = [decoder.decode(chunk) async for chunk in _read_chunked(reader)]
+        elif 'Content-Length' in response_headers:
+            try:
+                length = int(response_headers['Content-Length'])
+            except ValueError:
+                raise URLError(f'malformed Content-Length in response from {url}')
+            chunks = [decoder.decode(chunk) async for chunk in _read_length(reader, length)]
+        else:
+            chunks = [decoder.decode(chunk) async for chunk in _read_until_eof(reader)]
+        chunks.append(decoder.flush())
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            # The response has been read (or has failed already) so an error while closing is not worth reporting
+            pass
+
+    return HttpResponse(
+        url=url, status=status, headers=response_headers, body=b''.join(chunks), wire_size=decoder.wire_size)
+
+
+def _default_ssl_context():
+    global _async_ssl_context
+    if _async_ssl_context is None:
+        _async_ssl_context = ssl.create_default_context()
+    return _async_ssl_context
+
+
+async def _read_chunked(reader):
+    while True:
+        size_line = await reader.readline()
+        try:
+            size = int(size_line.split(b';')[0].strip(), 16)
+        except ValueError:
+            raise URLError(f'malformed chunk size: {size_line!r}')
+        if size == 0:
+            # Skip any trailer headers up to the final blank line
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            return
+        yield await reader.readexactly(size)
+        await reader.readline()
+
+
+async def _read_length(reader, length):
+    while length > 0:
+        chunk = await reader.readexactly(min(length, READ_CHUNK_SIZE))
+        length -= len(chunk)
+        yield chunk
+
+
+async def _read_until_eof(reader):
+    while chunk := await reader.read(READ_CHUNK_SIZE):
+        yield chunk
@@ -0,0 +1,100 @@
+import hashlib
+import os
+
+from blib.cache import provider_cache
+from blib.pdftext import pdf_text_backend
+
+# Bump when the way ids are found in files changes so that files are scanned again
+SCAN_INDEX_VERSION = 3
+
+HASH_CHUNK_SIZE = 1 << 20 # 1 MiB
+
+
+def file_digest(path):
+    """Return the SHA-256 hex digest of the contents of the file at `path`."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ScanIndex:
+    """
+    Persistent index of the resource id found in each scanned file, so that unchanged files are not scanned again.
+
+    Entries are keyed by the absolute path of a file and record its size, modification time and a hash of its
+    contents. A file with the same size and modification time as when it was scanned is taken to be unchanged without
+    reading it. Otherwise its contents are hashed and compared, which also recognises files which have been touched,
+    copied or moved without being modified. Files in which no id was found are indexed too.
+
+    Different pdf text backends (see `PDF_TEXT_BACKENDS`) can find different ids in the same file, so each `backend`
+    has its own entries. With `refresh` set no file is found in the index but the ids stored replace the existing
+    entries, which scans every file again and brings the index up to date.
+
+    The index is kept in the shared cache. If diskcache is missing nothing is indexed.
+    """
+
+    def __init__(self, cache=None, backend='auto', refresh=False):
+        self._cache = cache if cache is not None else provider_cache('scan')
+        self.backend = pdf_text_backend(backend)
+        self.refresh = refresh
+        self._digests = {}
+
+    def lookup(self, path):
+        """
+        Return `(True, resource_id)` if the file at `path` is in the index, where `resource_id` may be `None` if no id
+        was found in it, or `(False, None)` if the file needs to be scanned.
+        """
+        if self._cache is None or self.refresh:
+            return False, None
+
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = self._cache.get(self._path_key(path))
+        if self._is_current(entry) and (entry['size'], entry['mtime']) == (stat.st_size, stat.st_mtime_ns):
+            return True, entry['resource_id']
+
+        digest = self._digest(path)
+        if self._is_current(entry) and entry['hash'] == digest:
+            self.store(path, entry['resource_id'])
+            return True, entry['resource_id']
+
+        entry = self._cache.get(self._hash_key(digest))
+        if self._is_current(entry):
+            self.store(path, entry['resource_id'])
+            return True, entry['resource_id']
+
+        return False, None
+
+    def store(self, path, resource_id):
+        """Record that `resource_id` (or `None`) was found in the file at `path`."""
+        if self._cache is None:
+            return
+
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        digest = self._digest(path)
+        self._cache[self._path_key(path)] = {
+            'version': SCAN_INDEX_VERSION,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': digest,
+            'resource_id': resource_id,
+        }
+        self._cache[self._hash_key(digest)] = {'version': SCAN_INDEX_VERSION, 'resource_id': resource_id}
+
+    def _path_key(self, path):
+        return f'path:{self.backend}:{path}'
+
+    def _hash_key(self, digest):
+        return f'hash:{self.backend}:{digest}'
+
+    def _digest(self, path):
+        # A file is hashed at most once per run, between looking it up and storing the id found in it
+        if path not in self._digests:
+            self._digests[path] = file_digest(path)
+        return self._digests[path]
+
+    def _is_current(self, entry):
+        return entry is not None and entry.get('version') == SCAN_INDEX_VERSION
@@ -0,0 +1,83 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from blib.resourceid import ResourceId, ResourceIdType
+from blib.scanindex import ScanIndex
+
+
+class TestScanIndex(TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = self._directory.name
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def write(self, name, contents, mtime=None):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(contents)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def test_unchanged_files_are_found_in_the_index(self):
+        cache = {}
+        path = self.write('paper.pdf', b'contents')
+        resource_id = ResourceId('10.1000/a', ResourceIdType.doi)
+
+        self.assertEqual(ScanIndex(cache).lookup(path), (False, None))
+        ScanIndex(cache).store(path, resource_id)
+        self.assertEqual(ScanIndex(cache).lookup(path), (True, resource_id))
+
+    def test_files_without_an_id_are_indexed(self):
+        cache = {}
+        path = self.write('paper.pdf', b'contents')
+
+        ScanIndex(cache).store(path, None)
+
+        self.assertEqual(ScanIndex(cache).lookup(path), (True, None))
+
+    def test_touched_and_moved_files_are_recognised_by_their_contents(self):
+        cache = {}
+        path = self.write('paper.pdf', b'contents', mtime=1000)
+        resource_id = ResourceId('10.1000/a', ResourceIdType.doi)
+        ScanIndex(cache).store(path, resource_id)
+
+        self.write('paper.pdf', b'contents', mtime=2000)
+        self.assertEqual(ScanIndex(cache).lookup(path), (True, resource_id))
+
+        copy = self.write('copy.pdf', b'contents')
+        self.assertEqual(ScanIndex(cache).lookup(copy), (True, resource_id))
+
+    def test_modified_files_are_scanned_again(self):
+        cache = {}
+        path = self.write('paper.pdf', b'contents', mtime=1000)
+        ScanIndex(cache).store(path, ResourceId('10.1000/a', ResourceIdType.doi))
+
+        self.write('paper.pdf', b'modified', mtime=2000)
+
+        self.assertEqual(ScanIndex(cache).lookup(path), (False, None))
+
+    def test_each_backend_has_its_own_entries(self):
+        cache = {}
+        path = self.write('paper.pdf', b'contents')
+        resource_id = ResourceId('10.1000/a', ResourceIdType.doi)
+
+        ScanIndex(cache, backend='pdfplumber').store(path, resource_id)
+
+        self.assertEqual(ScanIndex(cache, backend='pdfplumber').lookup(path), (True, resource_id))
+        self.assertEqual(ScanIndex(cache, backend='pdftotext').lookup(path), (False, None))
+
+    def test_refresh_scans_indexed_files_again_and_replaces_their_entries(self):
+        cache = {}
+        path = self.write('paper.pdf', b'contents')
+        ScanIndex(cache, backend='pdfplumber').store(path, None)
+
+        index = ScanIndex(cache, backend='pdfplumber', refresh=True)
+        self.assertEqual(index.lookup(path), (False, None))
+        resource_id = ResourceId('10.1000/a', ResourceIdType.doi)
+        index.store(path, resource_id)
+
+        self.assertEqual(ScanIndex(cache, backend='pdfplumber').lookup(path), (True, resource_id))